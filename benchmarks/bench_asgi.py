@@ -0,0 +1,152 @@
+"""Compare the native ASGI components with the WSGI stack behind a
+WSGI-to-ASGI adapter.
+
+The adapter runs the WSGI application in the default executor of the event
+loop, one thread per request, and buffers the response, like the usual
+adapters do. Both stacks serve a number of concurrent requests for an HTML
+page that needs some resources, and for a resource file.
+
+Run with ``python benchmarks/bench_asgi.py``.
+"""
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+
+import webob
+
+import fanstatic
+import fanstatic.asgi
+
+
+CONCURRENCY = 50
+REQUESTS = 2000
+FILE_SIZE = 256 * 1024
+
+
+class WsgiToAsgi:
+    """A minimal WSGI-to-ASGI adapter."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': '',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.version': (1, 0),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (key.lower().encode('latin-1'), value.encode('latin-1'))
+                for key, value in headers]
+
+        def run():
+            result = self.app(environ, start_response)
+            try:
+                return b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+
+        body = await asyncio.get_running_loop().run_in_executor(None, run)
+        await send({
+            'type': 'http.response.start', 'status': response['status'],
+            'headers': response['headers']})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def build(directory):
+    registry = fanstatic.get_library_registry()
+    registry.clear()
+    library = fanstatic.Library('bench', directory)
+    registry.add(library)
+    resources = []
+    for i in range(20):
+        with open(os.path.join(directory, f'r{i}.js'), 'wb') as f:
+            f.write(b'x' * (FILE_SIZE if i == 0 else 100))
+        resources.append(fanstatic.Resource(
+            library, f'r{i}.js', depends=resources[-2:]))
+    registry.prepare()
+    return resources[-1]
+
+
+def wsgi_page(resource):
+    def app(environ, start_response):
+        resource.need()
+        response = webob.Response(
+            '<html><head></head><body>%s</body></html>' % ('x' * 10000))
+        return response(environ, start_response)
+    return app
+
+
+def asgi_page(resource):
+    body = b'<html><head></head><body>%s</body></html>' % (b'x' * 10000)
+
+    async def app(scope, receive, send):
+        resource.need()
+        await send({
+            'type': 'http.response.start', 'status': 200,
+            'headers': [(b'content-type', b'text/html; charset=UTF-8')]})
+        await send({'type': 'http.response.body', 'body': body})
+    return app
+
+
+async def serve(app, path):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    size = 0
+
+    async def request():
+        async def send(message):
+            nonlocal size
+            size += len(message.get('body', b''))
+
+        async with semaphore:
+            await app(
+                {'type': 'http', 'method': 'GET', 'path': path,
+                 'root_path': '', 'headers': []}, None, send)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request() for i in range(REQUESTS)))
+    return time.perf_counter() - start, size
+
+
+def main():
+    fanstatic.set_resource_file_existence_checking(False)
+    with tempfile.TemporaryDirectory() as directory:
+        resource = build(directory)
+        stacks = [
+            ('wrapped WSGI', WsgiToAsgi(fanstatic.Fanstatic(
+                wsgi_page(resource), versioning=True))),
+            ('native ASGI', fanstatic.asgi.Fanstatic(
+                asgi_page(resource), versioning=True)),
+        ]
+        for path in ['/', '/fanstatic/bench/:version:1/r0.js']:
+            print(f'{REQUESTS} requests for {path}, '
+                  f'{CONCURRENCY} concurrently:')
+            for name, app in stacks:
+                # Warm up.
+                asyncio.run(serve(app, path))
+                elapsed, size = asyncio.run(serve(app, path))
+                print(f'  {name:12}: {REQUESTS / elapsed:8.0f} requests/s '
+                      f'({size // REQUESTS} bytes each)')
+
+
+if __name__ == '__main__':
+    main()
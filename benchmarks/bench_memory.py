@@ -0,0 +1,123 @@
+"""Measure the memory used per request while serving 50 MB of large
+resources to concurrent clients.
+
+Ten clients download a bundle of five 1 MiB files each, and ten clients
+download a 5 MiB file each, all at the same time: the responses are
+consumed chunk by chunk, in turns. Bundles are either joined in memory
+(which is what happens to bundles up to ``BUFFER_LIMIT``) or streamed from
+their files; files are either read in Python or handed to a
+``wsgi.file_wrapper`` that uses ``os.sendfile``, like servers do. The peak
+memory allocated while serving is measured.
+
+Run with ``python benchmarks/bench_memory.py``.
+"""
+import os
+import tempfile
+import tracemalloc
+
+import webob
+
+import fanstatic
+import fanstatic.publisher
+
+
+CLIENTS = 10
+FILES_PER_BUNDLE = 5
+MiB = 1024 * 1024
+
+
+class SendfileWrapper:
+    """A ``wsgi.file_wrapper`` that sends the file to ``/dev/null``."""
+
+    def __init__(self, file, block_size):
+        self.file = file
+        self.block_size = block_size
+
+    def __iter__(self):
+        with open(os.devnull, 'wb') as devnull:
+            offset = 0
+            while True:
+                sent = os.sendfile(
+                    devnull.fileno(), self.file.fileno(), offset,
+                    self.block_size)
+                if not sent:
+                    break
+                offset += sent
+                yield b''
+
+    def close(self):
+        self.file.close()
+
+
+def build(directory):
+    library = fanstatic.Library('bench', directory)
+    paths = []
+    for i in range(CLIENTS):
+        names = []
+        for j in range(FILES_PER_BUNDLE):
+            name = f'b{i}_{j}.js'
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(b'x' * MiB)
+            fanstatic.Resource(library, name)
+            names.append(name)
+        paths.append(('bundle', '/bench/:bundle:' + ';'.join(names)))
+    for i in range(CLIENTS):
+        name = f'f{i}.js'
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(b'x' * FILES_PER_BUNDLE * MiB)
+        paths.append(('file', '/bench/' + name))
+    return fanstatic.Publisher(fanstatic.LibraryRegistry([library])), paths
+
+
+def serve(publisher, paths, environ):
+    """Serve ``paths`` to concurrent clients, return the bytes sent by
+    Python and the peak memory allocated meanwhile.
+    """
+    tracemalloc.start()
+    responses = []
+    for path in paths:
+        request = webob.Request.blank(path, environ=dict(environ))
+        app_iter = publisher(request.environ, lambda status, headers: None)
+        responses.append((app_iter, iter(app_iter)))
+    size = 0
+    while responses:
+        for response in list(responses):
+            try:
+                size += len(next(response[1]))
+            except StopIteration:
+                if hasattr(response[0], 'close'):
+                    response[0].close()
+                responses.remove(response)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, peak
+
+
+def main():
+    fanstatic.set_resource_file_existence_checking(False)
+    with tempfile.TemporaryDirectory() as directory:
+        publisher, paths = build(directory)
+        bundles = [path for kind, path in paths if kind == 'bundle']
+        files = [path for kind, path in paths if kind == 'file']
+        variants = [
+            ('bundles joined in memory', bundles, {}, float('inf')),
+            ('bundles streamed', bundles, {}, None),
+            ('files read in Python', files, {}, None),
+            ('files with file_wrapper', files,
+             {'wsgi.file_wrapper': SendfileWrapper}, None),
+        ]
+        for name, paths, environ, limit in variants:
+            fanstatic.publisher.bundle_cache.clear()
+            default = fanstatic.publisher.BUFFER_LIMIT
+            if limit is not None:
+                fanstatic.publisher.BUFFER_LIMIT = limit
+            try:
+                size, peak = serve(publisher, paths, environ)
+            finally:
+                fanstatic.publisher.BUFFER_LIMIT = default
+            print(f'{name:25}: {peak / CLIENTS / 1024:8.0f} KiB per request '
+                  f'({size / MiB:.0f} MiB through Python)')
+
+
+if __name__ == '__main__':
+    main()
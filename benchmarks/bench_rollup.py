@@ -0,0 +1,72 @@
+"""Measure ``rollup_resources`` with and without the registry's rollup
+index.
+
+A library has a number of components, each of which consists of a number
+of files rolled up in several overlapping ways. A page needs some of the
+components completely and a file of some others.
+
+Run with ``python benchmarks/bench_rollup.py``.
+"""
+import time
+
+import fanstatic
+from fanstatic.inclusion import rollup_resources
+
+
+COMPONENTS = 200
+FILES = 12
+ROLLUPS = 8
+PAGES = 2000
+
+
+def build():
+    registry = fanstatic.get_library_registry()
+    registry.clear()
+    library = fanstatic.Library('rollups', '')
+    registry.add(library)
+    pages = [[], []]
+    for c in range(COMPONENTS):
+        files = [
+            fanstatic.Resource(library, f'c{c}/f{f}.js')
+            for f in range(FILES)]
+        for r in range(ROLLUPS):
+            fanstatic.Resource(
+                library, f'c{c}/rollup{r}.js',
+                supersedes=files[r % 3:FILES - r // 3])
+        if c % 2:
+            pages[0].extend(files)
+        else:
+            pages[0].append(files[0])
+        pages[1].extend(files[:c % FILES])
+    registry.prepare()
+    return registry, pages
+
+
+def run(registry, resources):
+    start = time.perf_counter()
+    for i in range(PAGES):
+        indexed = rollup_resources(resources)
+    indexed_time = time.perf_counter() - start
+    index, registry.rollup_index = registry.rollup_index, None
+    try:
+        start = time.perf_counter()
+        for i in range(PAGES):
+            unindexed = rollup_resources(resources)
+        unindexed_time = time.perf_counter() - start
+    finally:
+        registry.rollup_index = index
+    assert indexed == unindexed
+    print(f'  {len(resources)} resources: '
+          f'{PAGES / unindexed_time:8.0f} pages/s unindexed, '
+          f'{PAGES / indexed_time:8.0f} pages/s indexed')
+
+
+def main():
+    fanstatic.set_resource_file_existence_checking(False)
+    registry, pages = build()
+    for resources in pages:
+        run(registry, resources)
+
+
+if __name__ == '__main__':
+    main()
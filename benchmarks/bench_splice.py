@@ -0,0 +1,81 @@
+"""Compare injecting inclusions into a large buffered HTML page with two
+``bytes.replace`` passes and ``Response.write`` (fanstatic 1.7 and earlier)
+with splicing memoryviews of the page.
+
+Both variants go through a webob response like the ``Injector`` does and
+send the resulting app_iter; the time and the peak memory allocated on top
+of the page itself are measured.
+
+Run with ``python benchmarks/bench_splice.py``.
+"""
+import time
+import tracemalloc
+
+import webob
+
+import fanstatic
+from fanstatic.injector import TopBottomInjector
+from fanstatic.injector import iter_bytes
+
+
+PAGE_SIZE = 5 * 1024 * 1024
+ROUNDS = 20
+
+
+def replace(injector, html, needed):
+    # The implementation of fanstatic 1.7 and earlier.
+    response = webob.Response(body=html)
+    top, bottom = injector.render_inclusions(needed)
+    result = response.body.replace(b'</head>', top + b'</head>', 1)
+    result = result.replace(b'</body>', bottom + b'</body>', 1)
+    response.body = b''
+    response.write(result)
+    return response.app_iter
+
+
+def splice(injector, html, needed):
+    response = webob.Response(body=html)
+    pieces = injector.splice(response.body, needed)
+    response.app_iter = iter_bytes(pieces)
+    response.content_length = sum(map(len, pieces))
+    return response.app_iter
+
+
+def send(app_iter):
+    size = 0
+    for chunk in app_iter:
+        size += len(chunk)
+    return size
+
+
+def main():
+    fanstatic.set_resource_file_existence_checking(False)
+    library = fanstatic.Library('bench', '')
+    fanstatic.get_library_registry().add(library)
+    resources = [
+        fanstatic.Resource(library, f'r{i}.js', bottom=i % 2)
+        for i in range(20)]
+    needed = fanstatic.init_needed(resources=resources)
+    injector = TopBottomInjector({'bottom': True})
+    filler = b'<p>' + b'x' * (PAGE_SIZE // 10) + b'</p>'
+    html = (
+        b'<html><head><title>report</title></head><body>' +
+        filler * 10 + b'</body></html>')
+
+    for name, inject in [('replace', replace), ('splice', splice)]:
+        size = send(inject(injector, html, needed))
+        start = time.perf_counter()
+        for i in range(ROUNDS):
+            send(inject(injector, html, needed))
+        elapsed = (time.perf_counter() - start) / ROUNDS
+        tracemalloc.start()
+        send(inject(injector, html, needed))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f'{name:8}: {elapsed * 1000:6.2f}ms per page, '
+              f'peak {peak / 1024 / 1024:5.1f} MiB extra '
+              f'({size / 1024 / 1024:.1f} MiB page)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Measure registration and ``add_dependency`` on diamond shaped graphs.
+
+A core resource is depended on by a layer of plugins, every plugin of the
+next layer depends on all plugins of the previous layer, and so on. The
+recursive, unmemoized ``list_supporting`` of earlier versions walks such a
+graph once per path, which is exponential in the number of layers. This
+compares it with the current implementation.
+
+Run with ``python benchmarks/bench_supporting.py``.
+"""
+import time
+
+import fanstatic
+from fanstatic.core import Dependable
+
+
+ADD_DEPENDENCIES = 50
+
+
+def recursive_list_supporting(self):
+    # The implementation of fanstatic 1.7 and earlier.
+    supports = set()
+    for dependable in self.supports:
+        supports.add(dependable)
+        supports.update(recursive_list_supporting(dependable))
+    return supports
+
+
+def build(width, depth):
+    registry = fanstatic.get_library_registry()
+    registry.clear()
+    library = fanstatic.Library('diamond', '')
+    registry.add(library)
+    core = fanstatic.Resource(library, 'core.js')
+    layer = [core]
+    for level in range(depth):
+        layer = [
+            fanstatic.Resource(library, f'l{level}_{i}.js', depends=layer)
+            for i in range(width)]
+    return library, core
+
+
+def run(width, depth):
+    for name, list_supporting in [
+            ('recursive', recursive_list_supporting),
+            ('memoized', Dependable.list_supporting)]:
+        original = Dependable.list_supporting
+        Dependable.list_supporting = list_supporting
+        try:
+            start = time.perf_counter()
+            library, core = build(width, depth)
+            registration = time.perf_counter() - start
+            start = time.perf_counter()
+            for i in range(ADD_DEPENDENCIES):
+                core.add_dependency(fanstatic.Resource(library, f'x{i}.js'))
+            add_dependency = time.perf_counter() - start
+        finally:
+            Dependable.list_supporting = original
+        print(f'  {name:9}: registration {registration:7.3f}s, '
+              f'{ADD_DEPENDENCIES} x add_dependency {add_dependency:7.3f}s')
+
+
+def main():
+    fanstatic.set_resource_file_existence_checking(False)
+    for width, depth in [(40, 3), (2, 14), (3, 9)]:
+        print(f'width {width}, depth {depth}:')
+        run(width, depth)
+
+
+if __name__ == '__main__':
+    main()
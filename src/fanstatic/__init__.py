@@ -25,6 +25,7 @@ from fanstatic.core import get_needed
 from fanstatic.core import init_needed
 from fanstatic.core import register_inclusion_renderer
 from fanstatic.core import set_auto_register_library
+from fanstatic.core import set_deferred_graph_construction
 from fanstatic.core import set_resource_file_existence_checking
 from fanstatic.inclusion import Inclusion
 from fanstatic.inclusion import bundle_resources
@@ -38,6 +39,7 @@ from fanstatic.publisher import make_publisher
 from fanstatic.registry import CompilerRegistry
 from fanstatic.registry import LibraryRegistry
 from fanstatic.registry import MinifierRegistry
+from fanstatic.registry import VersionMethodRegistry
 from fanstatic.registry import get_library_registry
 from fanstatic.wsgi import Fanstatic
 from fanstatic.wsgi import Serf
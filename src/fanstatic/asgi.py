@@ -0,0 +1,374 @@
+"""ASGI versions of the Fanstatic framework components.
+
+These mirror :py:func:`fanstatic.Fanstatic`, :py:class:`fanstatic.Injector`,
+:py:class:`fanstatic.Delegator` and :py:class:`fanstatic.Publisher`, but
+are native ASGI applications: files are read in the default executor of the
+event loop, and the needed resources are kept per task (see
+:py:func:`fanstatic.init_needed`).
+"""
+import asyncio
+import os.path
+import time
+
+import webob.datetime_utils
+import webob.exc
+
+import fanstatic
+import fanstatic.publisher
+from fanstatic import LibraryRegistry
+from fanstatic.injector import CONTENT_TYPES
+from fanstatic.injector import TopBottomInjector
+from fanstatic.injector import iter_bytes
+from fanstatic.publisher import FOREVER
+from fanstatic.publisher import BundleApp
+from fanstatic.publisher import http_date
+
+
+def Fanstatic(app,
+              publisher_signature=fanstatic.DEFAULT_SIGNATURE,
+              injector=None,
+              compress=False,
+              publisher_cache_size=1000,
+              **config):
+    """Fanstatic ASGI framework component.
+
+    :param app: The ASGI app to wrap with Fanstatic.
+
+    :param publisher_signature: Optional argument to define the
+      signature of the publisher in a URL. The default is ``fanstatic``.
+
+    :param injector: A injector callable.
+
+    :param compress: Not supported by the ASGI publisher yet, see
+      :py:class:`Publisher`.
+
+    :param publisher_cache_size: The ``cache_size`` of the publisher, the
+      maximum number of URLs it keeps resolved.
+
+    :param ``**config``: Optional keyword arguments. These are
+      passed to :py:class:`NeededInclusions` when it is constructed.
+    """
+    injector_middleware = Injector(
+        app,
+        publisher_signature=publisher_signature,
+        injector=injector,
+        **config)
+
+    publisher_middleware = Publisher(
+        LibraryRegistry.instance(), compress=compress,
+        cache_size=publisher_cache_size)
+
+    return Delegator(
+        injector_middleware,
+        publisher_middleware,
+        publisher_signature=publisher_signature)
+
+
+async def send_status(send, status, headers=()):
+    """Send a response with a short plain text body for ``status``.
+    """
+    body = b'' if status == 304 else str(status).encode('ascii')
+    headers = list(headers)
+    if body:
+        headers.append((b'content-type', b'text/plain'))
+    headers.append((b'content-length', b'%d' % len(body)))
+    await send({
+        'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def header(scope, name):
+    """Return the value of the request header ``name`` or ``None``.
+    """
+    for key, value in scope.get('headers', ()):
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return None
+
+
+def is_html(headers):
+    """Return whether the response ``headers`` have an HTML content type.
+    """
+    for key, value in headers:
+        if key.lower() == b'content-type':
+            content_type = value.split(b';', 1)[0].strip().lower()
+            return content_type.decode('latin-1') in CONTENT_TYPES
+    return False
+
+
+class Injector:
+    """Fanstatic injector ASGI framework component.
+
+    This ASGI component takes care of injecting the proper resource
+    inclusions into HTML when needed. HTML responses are buffered to do
+    so, unless ``stream`` is set, other responses are passed on as they
+    are.
+
+    The injector plugin is called without a request and response, these
+    are webob objects in the WSGI world.
+
+    :param app: The ASGI app to wrap with the injector.
+
+    :param stream: If set to ``True``, HTML responses are not buffered,
+      see :py:class:`fanstatic.Injector`.
+
+    :param ``**config``: Optional keyword arguments. These are passed
+      to :py:class:`NeededResources` when it is constructed.
+    """
+
+    def __init__(self, app, injector=None, stream=False, **config):
+        if injector is None:
+            injector = TopBottomInjector(config)
+
+        # This is just to validate config
+        fanstatic.NeededResources(**config)
+
+        self.app = app
+        self.config = config
+        self.injector = injector
+        self.stream = stream
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or \
+                scope['method'] not in ('GET', 'POST', 'HEAD'):
+            await self.app(scope, receive, send)
+            return
+
+        needed = fanstatic.init_needed(
+            script_name=scope.get('root_path'), **self.config)
+        try:
+            # Make the needed resources available in the scope as well,
+            # like the WSGI injector does in the environment.
+            scope = dict(scope)
+            scope[fanstatic.NEEDED] = needed
+            inject = scope['method'] != 'HEAD'
+            start = None
+            splicer = None
+            body = []
+
+            def add_headers(headers):
+                if needed.has_resources():
+                    for name, value in self.injector.response_headers(needed):
+                        headers.append((
+                            name.lower().encode('latin-1'),
+                            value.encode('latin-1')))
+
+            async def send_injected(message):
+                nonlocal start, splicer
+                if message['type'] == 'http.response.start':
+                    if inject and is_html(message.get('headers', ())):
+                        if self.stream:
+                            splicer = self.injector.splicer(needed)
+                        if splicer is None:
+                            # Hold on to it until the body is complete.
+                            start = message
+                            return
+                        message = dict(message, headers=[
+                            (key, value) for key, value in message['headers']
+                            if key.lower() != b'content-length'])
+                        add_headers(message['headers'])
+                elif splicer is not None and \
+                        message['type'] == 'http.response.body':
+                    pieces = splicer.feed(message.get('body', b''))
+                    if not message.get('more_body', False):
+                        pieces.append(splicer.close())
+                    message = dict(message, body=b''.join(pieces))
+                elif start is not None and \
+                        message['type'] == 'http.response.body':
+                    body.append(message.get('body', b''))
+                    if message.get('more_body', False):
+                        return
+                    pieces = [b''.join(body)]
+                    if needed.has_resources():
+                        pieces = self.injector.splice(pieces[0], needed)
+                    headers = [
+                        (key, value) for key, value in start['headers']
+                        if key.lower() != b'content-length']
+                    headers.append(
+                        (b'content-length', b'%d' % sum(map(len, pieces))))
+                    add_headers(headers)
+                    await send(dict(start, headers=headers))
+                    for piece in iter_bytes(pieces):
+                        await send({
+                            'type': 'http.response.body', 'body': piece,
+                            'more_body': True})
+                    message = {'type': 'http.response.body', 'body': b''}
+                await send(message)
+
+            await self.app(scope, receive, send_injected)
+        finally:
+            # Clean up after our behinds, also if the application raised.
+            fanstatic.del_needed()
+
+
+class Publisher(fanstatic.publisher.Publisher):
+    """Fanstatic publisher ASGI application.
+
+    This ASGI application serves Fanstatic :py:class:`Library`
+    instances, like :py:class:`fanstatic.Publisher` does, and shares its
+    routing: URLs are resolved by :py:meth:`fanstatic.Publisher.route` in
+    the default executor of the event loop, and kept in the bounded
+    ``routes`` and ``not_found`` caches.
+
+    Each response looks at and reads its files in a single call in the
+    executor, so serving them does not block the event loop. Responses
+    larger than :py:data:`fanstatic.publisher.BUFFER_LIMIT` are read in
+    blocks of that size instead.
+
+    :param registry: an instance of
+      :py:class:`LibraryRegistry` with those resource libraries that
+      should be published.
+
+    :param compress: Serving compressed resources is not supported yet,
+      setting this to ``True`` raises a ``ConfigurationError``.
+
+    :param cache_size: The maximum number of URLs kept in the routing
+      table, see :py:class:`fanstatic.Publisher`.
+    """
+
+    def __init__(self, registry, compress=False, cache_size=1000):
+        if compress:
+            raise fanstatic.ConfigurationError(
+                'The ASGI publisher cannot serve compressed resources.')
+        super().__init__(registry, cache_size=cache_size)
+
+    async def __call__(self, scope, receive, send):
+        path = scope['path']
+        loop = asyncio.get_running_loop()
+        route = self.routes.get(path)
+        if route is None:
+            try:
+                route = await loop.run_in_executor(None, self.resolve, path)
+            except webob.exc.HTTPException as e:
+                await send_status(send, e.code)
+                return
+        app, need_caching = route
+
+        if scope['method'] not in ('GET', 'HEAD'):
+            await send_status(send, 405, [(b'allow', b'GET, HEAD')])
+            return
+
+        headers = [
+            (name.lower().encode('ascii'), value.encode('ascii'))
+            for name, value in app.headers]
+        if need_caching:
+            headers.append(
+                (b'cache-control', b'max-age=%d' % FOREVER))
+            headers.append((
+                b'expires',
+                http_date(time.time() + FOREVER).encode('ascii')))
+        await self.send_files(scope, send, app, headers)
+
+    async def send_files(self, scope, send, app, headers):
+        if isinstance(app, BundleApp):
+            paths = app.filenames
+        else:
+            paths = [app.filename]
+        since = header(scope, b'if-modified-since')
+        if since is not None:
+            since = webob.datetime_utils.parse_date(since)
+            if since is not None:
+                since = since.timestamp()
+        loop = asyncio.get_running_loop()
+        try:
+            mtime, size, body = await loop.run_in_executor(
+                None, load_files, paths, since, scope['method'] == 'GET')
+        except OSError:
+            await send_status(send, 404)
+            return
+        last_modified = (b'last-modified', http_date(mtime).encode('ascii'))
+        if since is not None and mtime <= since:
+            await send_status(send, 304, [last_modified])
+            return
+
+        headers.append(last_modified)
+        headers.append((b'content-length', b'%d' % size))
+        await send({
+            'type': 'http.response.start', 'status': 200,
+            'headers': headers})
+        if body is not None or scope['method'] == 'HEAD':
+            await send({'type': 'http.response.body', 'body': body or b''})
+            return
+
+        for i, path in enumerate(paths):
+            if i:
+                await send({
+                    'type': 'http.response.body', 'body': b'\n',
+                    'more_body': True})
+            fh = await loop.run_in_executor(None, open, path, 'rb')
+            try:
+                while True:
+                    chunk = await loop.run_in_executor(
+                        None, fh.read, fanstatic.publisher.BUFFER_LIMIT)
+                    if not chunk:
+                        break
+                    await send({
+                        'type': 'http.response.body', 'body': chunk,
+                        'more_body': True})
+            finally:
+                fh.close()
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+def load_files(paths, since, read):
+    """Return the modification time (in whole seconds) and the size of the
+    files at ``paths`` joined by newlines, and their contents if ``read``
+    is true, they are not modified since the timestamp ``since`` and they
+    are not larger than :py:data:`fanstatic.publisher.BUFFER_LIMIT`.
+    """
+    stats = [os.stat(path) for path in paths]
+    mtime = int(max(stat.st_mtime for stat in stats))
+    # Bundled files are separated by newlines.
+    size = sum(stat.st_size for stat in stats) + len(paths) - 1
+    if not read or (since is not None and mtime <= since) or \
+            size > fanstatic.publisher.BUFFER_LIMIT:
+        return mtime, size, None
+    contents = []
+    for path in paths:
+        with open(path, 'rb') as fh:
+            contents.append(fh.read())
+    return mtime, size, b'\n'.join(contents)
+
+
+class Delegator:
+    """Fanstatic delegator ASGI framework component.
+
+    This ASGI component recognizes URLs that point to Fanstatic
+    libraries, and delegates them to the :py:class:`Publisher` ASGI
+    application, with the part of the path up to and including the
+    ``publisher_signature`` moved to the ``root_path``.
+
+    :param app: The ASGI app to wrap with the delegator.
+
+    :param publisher: An instance of the :py:class:`Publisher` component.
+
+    :param publisher_signature: Optional argument to define the
+      signature of the publisher in a URL. The default is ``fanstatic``.
+    """
+
+    def __init__(self, app, publisher,
+                 publisher_signature=fanstatic.DEFAULT_SIGNATURE):
+        self.app = app
+        self.publisher = publisher
+        self.publisher_signature = publisher_signature
+        self.trigger = '/%s/' % self.publisher_signature
+
+    def is_resource(self, scope):
+        return scope['type'] == 'http' and self.trigger in scope['path']
+
+    async def __call__(self, scope, receive, send):
+        if not self.is_resource(scope):
+            # the trigger segment is not in the URL, so we delegate
+            # to the original application
+            await self.app(scope, receive, send)
+            return
+        # the trigger is in there, so let whatever is behind the
+        # trigger be handled by the publisher
+        prefix, path = scope['path'].split(self.trigger, 1)
+        scope = dict(
+            scope,
+            root_path=(
+                scope.get('root_path', '') + prefix + '/' +
+                self.publisher_signature),
+            path='/' + path)
+        await self.publisher(scope, receive, send)
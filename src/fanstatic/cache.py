@@ -0,0 +1,114 @@
+import collections
+import threading
+import time
+
+
+class LRUCache:
+    """A thread-safe mapping with a bounded size.
+
+    When the cache is full, the least recently used entry is evicted to
+    make room for a new one. The ``hits``, ``misses`` and ``evictions``
+    counters can be inspected to find out how well the cache performs.
+
+    :param maxsize: the maximum number of entries kept in the cache. If
+      set to ``0``, nothing is cached at all; if set to ``None`` the
+      cache is unbounded.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.maxsize is None:
+                return
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        """Forget all entries. The counters are left untouched.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Return a dictionary with the counters and the current size.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+
+class TTLCache(LRUCache):
+    """A :py:class:`LRUCache` whose entries expire.
+
+    An entry is forgotten ``ttl`` seconds after it was set; getting an
+    expired entry counts as a miss.
+
+    :param maxsize: the maximum number of entries kept in the cache.
+
+    :param ttl: the number of seconds an entry is kept.
+    """
+
+    def __init__(self, maxsize=1000, ttl=60):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        super().set(key, (time.monotonic() + self.ttl, value))
+
+    def pop(self, key, default=None):
+        entry = super().pop(key)
+        if entry is None:
+            return default
+        return entry[1]
@@ -1,11 +1,28 @@
+import concurrent.futures
 import hashlib
+import json
+import logging
 import os
+import tempfile
+import threading
 from datetime import datetime
 
 
+logger = logging.getLogger('fanstatic')
+
+# The number of threads that read files to compute their digests.
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+
 VCS_NAMES = ['.svn', '.git', '.bzr', '.hg']
 IGNORED_EXTENSIONS = ['.swp', '.tmp', '.pyc', '.pyo']
 
+# The name of the manifest file in a library directory, see
+# :py:func:`write_manifest`.
+MANIFEST = 'fanstatic-manifest.json'
+
+# The extensions of precompressed variants of files.
+SIDECAR_EXTENSIONS = ('.br', '.gz')
+
 
 def list_directory(path, include_directories=True):
     # Skip over any VCS directories.
@@ -20,7 +37,7 @@ def list_directory(path, include_directories=True):
             yield os.path.join(root)
         for file in files:
             _, ext = os.path.splitext(file)
-            if ext in IGNORED_EXTENSIONS:
+            if ext in IGNORED_EXTENSIONS or file == MANIFEST:
                 continue
             yield os.path.join(root, file)
 
@@ -33,19 +50,230 @@ def mtime(path):
     return datetime.fromtimestamp(latest).isoformat()[:22]
 
 
+def default_digest_cache():
+    """Return the path of the file the digests of files are kept in between
+    processes, see :py:func:`md5`.
+
+    This is the ``FANSTATIC_DIGEST_CACHE`` environment variable if it is
+    set to a path, otherwise ``None``: digests are then only kept in
+    memory.
+    """
+    return os.environ.get('FANSTATIC_DIGEST_CACHE') or None
+
+
+_digest_cache = default_digest_cache()
+# path -> [size, mtime_ns, inode, digest], loaded from the digest cache.
+_digests = None
+_digests_lock = threading.Lock()
+
+
+def set_digest_cache(path):
+    """Set the file the digests of files are kept in between processes.
+
+    If ``None``, digests are only kept in memory.
+    """
+    global _digest_cache, _digests
+    with _digests_lock:
+        _digest_cache = path
+        _digests = None
+
+
+def load_digests():
+    if _digest_cache is None:
+        return {}
+    try:
+        with open(_digest_cache) as f:
+            digests = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(digests, dict):
+        return {}
+    return digests
+
+
+def save_digests(digests, directory=None):
+    """Add ``digests`` to the digest cache file.
+
+    If ``directory`` is given, the entries of files in it that no longer
+    exist are dropped.
+    """
+    if _digest_cache is None:
+        return
+    # Other processes may have added digests in the meantime.
+    merged = load_digests()
+    if directory is not None:
+        for path in stale_entries(merged, directory, digests):
+            del merged[path]
+    merged.update(digests)
+    directory = os.path.dirname(_digest_cache)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(merged, f)
+        os.replace(tmp, _digest_cache)
+    except OSError:
+        logger.warning('Could not write digest cache %s', _digest_cache)
+
+
+def stale_entries(digests, directory, found):
+    """Return the paths of the entries in ``digests`` of files in
+    ``directory`` that were not ``found`` and no longer exist.
+    """
+    prefix = os.path.join(directory, '')
+    return [
+        path for path in list(digests)
+        if path.startswith(prefix) and path not in found and
+        not os.path.exists(path)]
+
+
+def file_digest(path):
+    chcksm = hashlib.md5()
+    with open(path, 'rb') as f:
+        while True:
+            # 256kb chunks.
+            chunk = f.read(0x40000)
+            if not chunk:
+                break
+            chcksm.update(chunk)
+    return chcksm.hexdigest()
+
+
+def file_digests(paths, directory=None):
+    """Return the digests of the files at ``paths``, by path.
+
+    The digests are kept in the digest cache (see
+    :py:func:`set_digest_cache`), keyed by path and validated by size,
+    modification time and inode, so unchanged files are not read again,
+    not even by a new process. The other files are read in a thread pool.
+
+    If ``directory`` is given, the entries of files in it that no longer
+    exist are dropped from the cache.
+    """
+    return {
+        path: entry[3]
+        for path, entry in _digest_entries(paths, directory).items()}
+
+
+def _digest_entries(paths, directory=None):
+    # Return the [size, mtime_ns, inode, digest] entries of the files at
+    # paths, by path.
+    global _digests
+    with _digests_lock:
+        if _digests is None:
+            _digests = load_digests()
+        digests = _digests
+    found = {}
+    missing = {}
+    for path in paths:
+        stat = os.stat(path)
+        key = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        entry = digests.get(path)
+        if entry is not None and entry[:3] == key:
+            found[path] = entry
+        else:
+            missing[path] = key
+    if missing:
+        if len(missing) == 1 or MAX_WORKERS == 1:
+            results = map(file_digest, missing)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=min(len(missing), MAX_WORKERS)) as pool:
+                results = list(pool.map(file_digest, missing))
+        for (path, key), digest in zip(missing.items(), results):
+            found[path] = missing[path] = key + [digest]
+    stale = []
+    if directory is not None:
+        stale = stale_entries(digests, directory, found)
+    if missing or stale:
+        with _digests_lock:
+            for path in stale:
+                digests.pop(path, None)
+            digests.update(missing)
+        # Outside of the lock, other threads need not wait for the file.
+        save_digests(missing, directory)
+    return found
+
+
 def md5(path):
+    """Return a checksum of the paths and contents of the files in the
+    directory ``path``.
+
+    The digests of the files are computed by :py:func:`file_digests`.
+    """
+    paths = sorted(list_directory(path, include_directories=False))
+    found = file_digests(paths, path)
+
+    # Combine the digests in the order of the paths, so the checksum does
+    # not depend on the order in which the files were read.
     chcksm = hashlib.md5()
-    for path in sorted(list(list_directory(path, include_directories=False))):
+    for path in paths:
         chcksm.update(path.encode('utf-8'))
-        try:
-            f = open(path, 'rb')
-            while True:
-                # 256kb chunks.
-                # XXX how to optimize chunk size?
-                chunk = f.read(0x40000)
-                if not chunk:
-                    break
-                chcksm.update(chunk)
-        finally:
-            f.close()
+        chcksm.update(found[path].encode('ascii'))
     return chcksm.hexdigest()
+
+
+def content(path):
+    """Return a checksum of the relative paths, sizes and contents of the
+    published files in the directory ``path``.
+
+    Unlike :py:func:`mtime` and :py:func:`md5`, this does not depend on
+    modification times or on where the directory is, so every server with
+    the same files computes the same checksum. Precompressed variants of
+    files (see :py:mod:`fanstatic.compression`) are left out, as they are
+    derived from the files themselves. The digests of the files come from
+    :py:func:`file_digests`, so they are only read once.
+    """
+    paths = sorted(list_directory(path, include_directories=False))
+    published = set(paths)
+    paths = [
+        file for file in paths
+        if not file.endswith(SIDECAR_EXTENSIONS) or
+        os.path.splitext(file)[0] not in published]
+    entries = _digest_entries(paths, path)
+
+    prefix = len(os.path.join(path, ''))
+    chcksm = hashlib.md5()
+    for file in paths:
+        size, _, _, digest = entries[file]
+        relpath = file[prefix:].replace(os.sep, '/')
+        chcksm.update(b'%s\0%d\0' % (relpath.encode('utf-8'), size))
+        chcksm.update(digest.encode('ascii'))
+    return chcksm.hexdigest()
+
+
+def write_manifest(path, files=False):
+    """Write the signature of the directory ``path`` to the manifest file
+    in it, so it does not need to be computed at run time, see
+    :py:func:`read_manifest`.
+
+    The signature is the :py:func:`md5` checksum of the directory. If
+    ``files`` is true, the md5 digests of the files, by path relative to
+    ``path`` and separated by slashes, are written as well. The manifest
+    itself is not part of the signature. Returns the path of the manifest.
+    """
+    manifest = {'signature': md5(path)}
+    if files:
+        paths = sorted(list_directory(path, include_directories=False))
+        manifest['files'] = {
+            os.path.relpath(file, path).replace(os.sep, '/'): digest
+            for file, digest in file_digests(paths).items()}
+    target = os.path.join(path, MANIFEST)
+    with open(target, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return target
+
+
+def read_manifest(path):
+    """Return the manifest written by :py:func:`write_manifest` in the
+    directory ``path``, or ``None`` if there is no (valid) manifest.
+    """
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or \
+            not isinstance(manifest.get('signature'), str):
+        return None
+    return manifest
@@ -1,5 +1,6 @@
 import argparse
 import logging
+import mimetypes
 import os.path
 import subprocess
 import sys
@@ -9,6 +10,9 @@ from shutil import which
 import setuptools.command.sdist
 
 import fanstatic
+import fanstatic.checksum
+from fanstatic.compression import is_compressible
+from fanstatic.compression import write_sidecars
 
 
 mtime = os.path.getmtime
@@ -92,12 +96,32 @@ class Minifier(Compiler):
         return resource.fullpath(self.source_to_target(resource))
 
 
-def _compile_resources(package):
+def _compile_resources(package, compress=False, manifest=False,
+                       manifest_files=False):
     for library in fanstatic.LibraryRegistry.instance().values():
         if not library.module.startswith(package):
             continue
         for resource in library.known_resources.values():
             resource.compile(force=True)
+        if compress:
+            # After compiling, so the minified files are there as well.
+            for resource in library.known_resources.values():
+                _compress_resource(resource)
+        if (manifest or manifest_files) and library.version is None:
+            # Last, so the signature covers all files written.
+            target = fanstatic.checksum.write_manifest(
+                library.path, files=manifest_files)
+            logger.info('Wrote manifest %s for %s', target, library)
+
+
+def _compress_resource(resource):
+    path = resource.fullpath()
+    content_type, encoding = mimetypes.guess_type(path)
+    if encoding or not os.path.isfile(path) or \
+            not is_compressible(content_type or ''):
+        return
+    for target in write_sidecars(path):
+        logger.info('Compressed %s into %s', resource, target)
 
 
 def compile_resources(argv=sys.argv):
@@ -109,19 +133,52 @@ def compile_resources(argv=sys.argv):
     parser.add_argument(
         '-v', '--verbose', dest='verbose',
         action='store_true', help='Verbose output')
+    parser.add_argument(
+        '-z', '--compress', dest='compress',
+        action='store_true',
+        help='Also write .gz (and .br) variants of the resources')
+    parser.add_argument(
+        '-m', '--manifest', dest='manifest',
+        action='store_true',
+        help='Write the signatures of the libraries to manifest files')
+    parser.add_argument(
+        '--manifest-files', dest='manifest_files',
+        action='store_true',
+        help='Write manifest files with the digests of all files as well')
     options = parser.parse_args()
     if options.verbose:
         # setup logger to output to console
         logging.basicConfig(level=logging.INFO)
-    _compile_resources(options.package)
+    _compile_resources(
+        options.package, compress=options.compress,
+        manifest=options.manifest, manifest_files=options.manifest_files)
 
 
 class sdist_compile(setuptools.command.sdist.sdist):
 
+    user_options = setuptools.command.sdist.sdist.user_options + [
+        ('compress', None,
+         'also write .gz (and .br) variants of the resources'),
+        ('manifest', None,
+         'write the signatures of the libraries to manifest files'),
+        ('manifest-files', None,
+         'write manifest files with the digests of all files as well'),
+    ]
+    boolean_options = setuptools.command.sdist.sdist.boolean_options + [
+        'compress', 'manifest', 'manifest-files']
+
+    def initialize_options(self):
+        setuptools.command.sdist.sdist.initialize_options(self)
+        self.compress = False
+        self.manifest = False
+        self.manifest_files = False
+
     def run(self):
         self._activate_distribution()
         for package in self.distribution.packages:
-            _compile_resources(package)
+            _compile_resources(
+                package, compress=self.compress, manifest=self.manifest,
+                manifest_files=self.manifest_files)
         # this is kludgy. egg_info does two things, writing egg-info *and*
         # finding all files. But since we generate more files, we need to
         # trigger the finding step again to have them picked up.
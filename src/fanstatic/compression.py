@@ -0,0 +1,94 @@
+import gzip
+import os.path
+
+
+try:
+    import brotli
+except ModuleNotFoundError:  # pragma: no cover
+    brotli = None
+
+
+# Besides text/*, these content types are worth compressing.
+COMPRESSIBLE_TYPES = {
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+}
+
+
+def gzip_compress(data):
+    # A fixed mtime keeps the output the same for the same input.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def brotli_compress(data):
+    return brotli.compress(data)
+
+
+# (content coding, sidecar extension, compress function) for the available
+# encodings, the one preferred by the server first.
+ENCODINGS = [('gzip', '.gz', gzip_compress)]
+if brotli is not None:  # pragma: no cover
+    ENCODINGS.insert(0, ('br', '.br', brotli_compress))
+
+
+def is_compressible(content_type):
+    """Return whether responses of ``content_type`` are worth compressing.
+    """
+    content_type = content_type.split(';', 1)[0].strip().lower()
+    return (
+        content_type.startswith('text/') or
+        content_type in COMPRESSIBLE_TYPES)
+
+
+def negotiate(accept_encoding):
+    """Return the ``(coding, extension, compress)`` entry of
+    :py:data:`ENCODINGS` to use for the ``Accept-Encoding`` request header,
+    or ``None`` to not encode the response.
+    """
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        qualities[coding.strip().lower()] = quality
+    default = qualities.get('*', 0)
+    for encoding in ENCODINGS:
+        if qualities.get(encoding[0], default) > 0:
+            return encoding
+    return None
+
+
+def write_sidecars(path):
+    """Write precompressed variants of the file at ``path`` next to it,
+    one for every encoding in :py:data:`ENCODINGS`.
+
+    Variants that are up to date are left alone, and no variant is written
+    if it would not be smaller than the file itself. Returns the paths of
+    the variants written.
+    """
+    written = []
+    data = None
+    for coding, extension, compress in ENCODINGS:
+        target = path + extension
+        if os.path.isfile(target) and \
+                os.path.getmtime(target) >= os.path.getmtime(path):
+            continue
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        compressed = compress(data)
+        if len(compressed) >= len(data):
+            continue
+        with open(target, 'wb') as f:
+            f.write(compressed)
+        written.append(target)
+    return written
@@ -4,7 +4,12 @@ from fanstatic import MINIFIED
 
 BOOL_CONFIG = {'versioning', 'recompute_hashes', DEBUG, MINIFIED,
                'bottom', 'force_bottom', 'bundle', 'rollup',
-               'versioning_use_md5', 'compile'}
+               'versioning_use_md5', 'compile', 'stream', 'preload_only',
+               'compress', 'watch'}
+
+INT_CONFIG = {'inclusion_cache_size', 'publisher_cache_size'}
+
+FLOAT_CONFIG = {'recompute_interval'}
 
 
 # From paste.util.converters.
@@ -26,6 +31,10 @@ def convert_config(config):
     for key, value in config.items():
         if key in BOOL_CONFIG:
             result[key] = asbool(value)
+        elif key in INT_CONFIG:
+            result[key] = int(value)
+        elif key in FLOAT_CONFIG:
+            result[key] = float(value)
         else:
             result[key] = value
     return result
@@ -1,9 +1,14 @@
+import contextvars
+import itertools
 import os
 import sys
 import threading
+import time
 
+import fanstatic.cache
 import fanstatic.checksum
 import fanstatic.registry
+import fanstatic.watcher
 
 
 DEFAULT_SIGNATURE = 'fanstatic'
@@ -19,6 +24,7 @@ MINIFIED = 'minified'
 
 _resource_file_existence_checking = True
 _auto_register_library = False
+_deferred_graph_construction = False
 
 
 def set_resource_file_existence_checking(v):
@@ -49,6 +55,125 @@ def set_auto_register_library(v):
     _auto_register_library = v
 
 
+resolution_cache = fanstatic.cache.LRUCache(maxsize=1000)
+"""Process-wide cache of resolved resources.
+
+Maps the needed dependables and slot fillings of a
+:py:class:`NeededResources` to the set of resources that will be included,
+so that the common combinations of needed resources are only resolved once.
+"""
+
+filled_slot_cache = fanstatic.cache.LRUCache(maxsize=1000)
+"""Process-wide cache of :py:class:`FilledSlot` instances.
+
+Maps a slot and the resource it is filled with to the validated
+``FilledSlot``, see :py:func:`fill_slot`.
+"""
+
+
+_resolution_generation = 0
+
+
+def invalidate_resolution_cache():
+    """Forget all cached resolutions.
+
+    This is called whenever the dependency graph or the library registry
+    changes.
+    """
+    global _resolution_generation
+    _resolution_generation += 1
+    resolution_cache.clear()
+    filled_slot_cache.clear()
+
+
+def resolution_generation():
+    """Return a number that changes every time the resolution cache is
+    invalidated.
+
+    Caches of data derived from resolutions, such as rendered inclusions,
+    include it in their keys to notice changes of the dependency graph.
+    """
+    return _resolution_generation
+
+
+def set_deferred_graph_construction(v):
+    """Set deferred construction of the dependency graph to True or False.
+
+    By default, this is set to False, and every :py:class:`Resource`,
+    :py:class:`Slot` and :py:class:`Group` computes its closure (its
+    ``resources``) and pushes it to the dependables that depend on it as
+    soon as it is created. For libraries that declare thousands of
+    resources this makes importing them roughly quadratic.
+
+    When set to True, creating a dependable only records the dependency
+    edges. The closures are computed, and library dependency cycles are
+    checked, in a single topological pass when the registry is prepared
+    or when a closure is first accessed.
+    """
+    global _deferred_graph_construction
+    _deferred_graph_construction = v
+
+
+_deferred_dependables = []
+_deferred_lock = threading.RLock()
+
+
+def compute_deferred_closures():
+    """Compute the closures of the dependables whose construction was
+    deferred, and of all dependables that depend on them.
+
+    This is a single topological pass over the affected dependables.
+    """
+    with _deferred_lock:
+        if not _deferred_dependables:
+            return
+        pending = list(_deferred_dependables)
+        del _deferred_dependables[:]
+
+        # Everything that depends on a pending dependable, directly or
+        # indirectly, needs a new closure as well.
+        affected = dict.fromkeys(pending)
+        stack = list(pending)
+        while stack:
+            for supporter in stack.pop().supports:
+                if supporter not in affected:
+                    affected[supporter] = None
+                    stack.append(supporter)
+
+        # Order the affected dependables so that dependencies come first.
+        ordered = []
+        visited = set()
+        for root in affected:
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(root.depends))]
+            while stack:
+                dependable, depends = stack[-1]
+                for depend in depends:
+                    if depend in affected and depend not in visited:
+                        visited.add(depend)
+                        stack.append((depend, iter(depend.depends)))
+                        break
+                else:
+                    stack.pop()
+                    ordered.append(dependable)
+
+        for dependable in ordered:
+            if isinstance(dependable, Asset):
+                closure = {dependable}
+            else:
+                closure = set()
+            for depend in dependable.depends:
+                closure.update(depend._resource_set())
+            dependable.resources = closure
+
+        for dependable in ordered:
+            if isinstance(dependable, Asset):
+                dependable.library.check_dependency_cycle(dependable)
+    invalidate_resolution_cache()
+
+
 class UnknownResourceExtensionError(Exception):
     """A resource has an unrecognized extension.
     """
@@ -122,6 +247,7 @@ class Library:
     """
 
     _signature = None
+    _signature_time = None
 
     def __init__(self, name, rootpath, ignores=None, version=None,
                  compilers=None, minifiers=None):
@@ -135,6 +261,7 @@ class Library:
         self.known_assets = []
         self.library_nr = None
         self.module = sys._getframe(1).f_globals['__name__']
+        self._signature_lock = threading.Lock()
 
         self.compilers = compilers
         if self.compilers is None:
@@ -200,31 +327,70 @@ class Library:
             self.known_resources[resource.relpath] = resource
         self.known_assets.append(resource)
 
-    def signature(self, recompute_hashes=False, version_method=None):
+    def signature(self, recompute_hashes=False, version_method=None,
+                  watcher=None, interval=None):
         """Get a unique signature for this Library.
 
         If a version has been defined, we return the version.
 
         If no version is defined, a hash of the contents of the directory
-        indicated by ``path`` is calculated.
+        indicated by ``path`` is calculated, unless a manifest with the
+        signature was written at build time (see
+        :py:func:`fanstatic.checksum.write_manifest`).
         If ``recompute_hashes`` is set to ``True``, the signature will be
         recalculated each time, which is useful during development when
-        changing Javascript/css code and images.
+        changing Javascript/css code and images. If a ``watcher`` (see
+        :py:mod:`fanstatic.watcher`) is given as well, it is only
+        recalculated after the directory changed. Otherwise, if an
+        ``interval`` is given, it is recalculated at most once every
+        ``interval`` seconds, by one thread at a time: other threads use the
+        previous signature meanwhile.
         """
         if self.version is not None:
             return VERSION_PREFIX + self.version
 
-        if recompute_hashes:
+        if recompute_hashes and watcher is not None:
+            # Re-compute when the watcher noticed a change.
+            if watcher.check(self.path) or self._signature is None:
+                self._signature = version_method(self.path)
+            sig = self._signature
+        elif recompute_hashes and interval is not None:
+            # Re-compute when the interval passed, unless another thread
+            # is already doing so.
+            sig = self._signature
+            if self._signature_expired(interval) and \
+                    self._signature_lock.acquire(blocking=sig is None):
+                try:
+                    if self._signature_expired(interval):
+                        self._signature = version_method(self.path)
+                        self._signature_time = time.monotonic()
+                    sig = self._signature
+                finally:
+                    self._signature_lock.release()
+        elif recompute_hashes:
             # Always re-compute.
             sig = version_method(self.path)
         elif self._signature is None:
-            # Only compute if not computed before.
-            sig = self._signature = version_method(self.path)
+            # Only compute if not computed before, or read it from the
+            # manifest written at build time.
+            with self._signature_lock:
+                if self._signature is None:
+                    manifest = fanstatic.checksum.read_manifest(self.path)
+                    if manifest is not None:
+                        self._signature = manifest['signature']
+                    else:
+                        self._signature = version_method(self.path)
+                sig = self._signature
         else:
             # Use cached value.
             sig = self._signature
         return VERSION_PREFIX + sig
 
+    def _signature_expired(self, interval):
+        return (
+            self._signature is None or self._signature_time is None or
+            time.monotonic() - self._signature_time >= interval)
+
 
 # Total hack to be able to get the dir the resources will be in.
 def caller_dir():
@@ -300,6 +466,11 @@ class Renderable:
     A renderable must have a library attribute and a dependency_nr.
     """
 
+    rank = None
+    """The position of this renderable in the global sort order of
+    resources, assigned when the registry is prepared.
+    """
+
     def render(self, library_url):
         """Render this renderable as something to insert in HTML.
 
@@ -311,9 +482,37 @@ class Renderable:
 class Dependable:
     """Dependables have a dependencies and an a resources attributes.
     """
-    resources = None
     depends = None
     supports = None
+    _resources = None
+    # (ClosureIndex, offset, bits) when the closure is packed in an index.
+    _closure = None
+    _supporting = None
+
+    @property
+    def resources(self):
+        if _deferred_dependables:
+            compute_deferred_closures()
+        return self._resource_set()
+
+    @resources.setter
+    def resources(self, resources):
+        self._resources = resources
+        self._closure = None
+
+    def _resource_set(self):
+        resources = self._resources
+        if resources is None and self._closure is not None:
+            index, offset, bits = self._closure
+            resources = set(index.decode(bits, offset))
+        return resources
+
+    def _add_resources(self, resources):
+        if self._resources is None:
+            self.resources = self._resource_set()
+        else:
+            self._closure = None
+        self._resources.update(resources)
 
     def add_dependency(self, dependency):
         if dependency in self.depends:
@@ -331,11 +530,50 @@ class Dependable:
         raise NotImplementedError()
 
     def list_supporting(self):
-        supports = set()
-        for dependable in self.supports:
-            supports.add(dependable)
-            supports.update(dependable.list_supporting())
-        return supports
+        """Return all dependables that depend on this one, directly or
+        indirectly.
+
+        The result is cached on every dependable that is visited, and the
+        caches are invalidated when a dependency is added below them, so
+        that diamond shaped graphs are only walked once.
+        """
+        if self._supporting is None:
+            # Depth first, so that the supporting dependables of all
+            # direct supporters are known before they are combined.
+            visiting = {self}
+            stack = [(self, iter(self.supports))]
+            while stack:
+                dependable, supports = stack[-1]
+                for supporter in supports:
+                    if (supporter._supporting is None
+                            and supporter not in visiting):
+                        visiting.add(supporter)
+                        stack.append((supporter, iter(supporter.supports)))
+                        break
+                else:
+                    stack.pop()
+                    supporting = set(dependable.supports)
+                    for supporter in dependable.supports:
+                        if supporter._supporting is not None:
+                            supporting.update(supporter._supporting)
+                    dependable._supporting = frozenset(supporting)
+        return self._supporting
+
+    def add_supporter(self, dependable):
+        """Record that ``dependable`` depends on this dependable.
+        """
+        if dependable in self.supports:
+            return
+        self.supports.add(dependable)
+        # Forget the cached supporting dependables of this dependable and
+        # of everything it depends on. A dependable is only cached when all
+        # its supporters are, so we can stop at the first one that isn't.
+        stack = [self]
+        while stack:
+            dependable = stack.pop()
+            if dependable._supporting is not None:
+                dependable._supporting = None
+                stack.extend(dependable.depends)
 
 
 class Asset(Dependable):
@@ -344,6 +582,10 @@ class Asset(Dependable):
 
     def __init__(self, library, depends=None):
         self.library = library
+        # Set when the registry is prepared. Setting them here already
+        # keeps the attributes of all assets in a compact, shared layout.
+        self.dependency_nr = None
+        self.rank = None
         self.supports = set()
         self.set_dependencies(depends)
         self.library.register(self)
@@ -355,17 +597,25 @@ class Asset(Dependable):
         else:
             self.depends = set()
 
+        if _deferred_graph_construction:
+            for depend in self.depends:
+                depend.add_supporter(self)
+            _deferred_dependables.append(self)
+            invalidate_resolution_cache()
+            return
+
         self.resources = {self}
         for depend in self.depends:
-            depend.supports.add(self)
+            depend.add_supporter(self)
             self.resources.update(depend.resources)
 
         # Update resources if needed.
         for dependable in self.list_supporting():
-            dependable.resources.update(self.resources)
+            dependable._add_resources(self.resources)
 
         # Check for library dependency cycles.
         self.library.check_dependency_cycle(self)
+        invalidate_resolution_cache()
 
     def list_assets(self):
         return {self}
@@ -375,6 +625,10 @@ class Asset(Dependable):
         dependency_nr = 0
         for depend in self.depends:
             for asset in depend.list_assets():
+                if asset.dependency_nr is None:
+                    # A dependency that was added after this asset was
+                    # created, so it comes later in the known assets.
+                    asset.init_dependency_nr()
                 dependency_nr = max(asset.dependency_nr + 1, dependency_nr)
         self.dependency_nr = dependency_nr
 
@@ -658,7 +912,7 @@ class FilledSlot(Renderable):
 
         self.modes = {}
         for key, resource in resource.modes.items():
-            self.modes[key] = FilledSlot(slot, resource)
+            self.modes[key] = fill_slot(slot, resource)
 
         if not resource.depends.issubset(slot.depends):
             raise SlotError(
@@ -688,6 +942,23 @@ class FilledSlot(Renderable):
             return self
 
 
+def fill_slot(slot, resource):
+    """Return the :py:class:`FilledSlot` for ``slot`` filled in with
+    ``resource``.
+
+    Filled slots are interned in the bounded ``filled_slot_cache``, so that
+    they are only created and validated once for every slot and resource.
+    Two threads may both create the same filled slot, but only one of them
+    is kept.
+    """
+    key = (slot, resource)
+    filled_slot = filled_slot_cache.get(key)
+    if filled_slot is None:
+        filled_slot = FilledSlot(slot, resource)
+        filled_slot_cache.set(key, filled_slot)
+    return filled_slot
+
+
 class Group(Dependable):
     """A resource used to group resources together.
 
@@ -706,13 +977,22 @@ class Group(Dependable):
 
     def set_dependencies(self, depends):
         self.depends = set(depends)
+
+        if _deferred_graph_construction:
+            for depend in self.depends:
+                depend.add_supporter(self)
+            _deferred_dependables.append(self)
+            invalidate_resolution_cache()
+            return
+
         self.resources = set()
         for depend in self.depends:
-            depend.supports.add(self)
+            depend.add_supporter(self)
             self.resources.update(depend.resources)
 
         for dependable in self.list_supporting():
-            dependable.resources.update(self.resources)
+            dependable._add_resources(self.resources)
+        invalidate_resolution_cache()
 
     def list_assets(self):
         assets = set()
@@ -742,6 +1022,190 @@ class Group(Dependable):
 GroupResource = Group
 
 
+_BINARY_DIGITS = bytes.maketrans(b'01', b'\x00\x01')
+
+
+class ClosureIndex:
+    """Bitmask representation of the dependency closures of assets.
+
+    Every known asset gets a dense integer index, and the closures (the
+    ``resources``) of the indexed assets and of the groups depending on
+    them are packed into it: a closure is stored as an integer with the
+    bits of its assets set, shifted down to its lowest asset, instead of
+    as a set. The ``resources`` attribute decodes it when it is asked
+    for. Resolving a set of needed dependables boils down to OR-ing their
+    closures and decoding the result once.
+
+    The index is built by :py:meth:`LibraryRegistry.prepare`. Dependables
+    whose dependencies change later get a set again.
+
+    :param libraries: the libraries whose assets are indexed.
+    """
+
+    def __init__(self, libraries):
+        self.assets = []
+        self.positions = {}
+        self.slots = 0
+        for library in libraries:
+            for asset in library.known_assets:
+                position = self.positions[asset] = len(self.assets)
+                self.assets.append(asset)
+                if isinstance(asset, Slot):
+                    self.slots |= 1 << position
+        # Pack the closures of the assets and the groups that depend on
+        # them.
+        dependables = dict.fromkeys(self.assets)
+        stack = list(self.assets)
+        while stack:
+            for supporter in stack.pop().supports:
+                if supporter not in dependables:
+                    dependables[supporter] = None
+                    stack.append(supporter)
+        closures = self.combine_closures(dependables)
+        for dependable in dependables:
+            closure = closures[dependable]
+            if closure is not None:
+                self.store(dependable, closure)
+
+    def __len__(self):
+        return len(self.assets)
+
+    def combine_closures(self, dependables):
+        """Return the closures of ``dependables`` (and of what they depend
+        on) as bitmasks, by dependable, with ``None`` for closures with
+        assets that are not indexed.
+
+        The closure of a dependable is combined from the closures of its
+        dependencies, in a single pass with dependencies first.
+        """
+        closures = {}
+        for root in dependables:
+            if root in closures:
+                continue
+            stack = [(root, iter(root.depends))]
+            while stack:
+                dependable, depends = stack[-1]
+                for depend in depends:
+                    if depend not in closures:
+                        stack.append((depend, iter(depend.depends)))
+                        break
+                else:
+                    stack.pop()
+                    closures[dependable] = self.combine(dependable, closures)
+        return closures
+
+    def combine(self, dependable, closures):
+        if isinstance(dependable, Asset):
+            position = self.positions.get(dependable)
+            if position is None:
+                return None
+            closure = 1 << position
+        else:
+            closure = 0
+        for depend in dependable.depends:
+            depend_closure = closures[depend]
+            if depend_closure is None:
+                return None
+            closure |= depend_closure
+        return closure
+
+    def store(self, dependable, closure):
+        offset = (closure & -closure).bit_length() - 1 if closure else 0
+        # The bitmask is in place before the set goes, for concurrent
+        # readers of resources.
+        dependable._closure = (self, offset, closure >> offset)
+        dependable._resources = None
+
+    def pack(self, dependable):
+        """Store the closure of ``dependable`` as a bitmask, and return it.
+
+        Returns ``None``, and leaves the closure alone, if it contains
+        assets that are not indexed.
+        """
+        resources = dependable.resources
+        try:
+            positions = [self.positions[asset] for asset in resources]
+        except KeyError:
+            return None
+        digits = bytearray(max(positions, default=0) // 8 + 1)
+        for position in positions:
+            digits[position >> 3] |= 1 << (position & 7)
+        closure = int.from_bytes(digits, 'little')
+        self.store(dependable, closure)
+        return closure
+
+    def closure(self, dependable):
+        """Return the closure of ``dependable`` as a bitmask.
+
+        Raises ``KeyError`` if the closure contains assets that are not
+        indexed.
+        """
+        offset, bits = self.packed(dependable)
+        return bits << offset
+
+    def packed(self, dependable):
+        # Return the closure of dependable as a bitmask shifted down by an
+        # offset, and the offset.
+        packed = dependable._closure
+        if packed is None or packed[0] is not self:
+            if self.pack(dependable) is None:
+                raise KeyError(dependable)
+            packed = dependable._closure
+        return packed[1], packed[2]
+
+    def decode(self, closure, offset=0):
+        """Return the list of assets that are set in ``closure``, shifted
+        down by ``offset``.
+        """
+        if not closure:
+            return []
+        # The binary digits of the closure, least significant first, as
+        # a selector for the assets.
+        selectors = format(closure, 'b').encode('ascii')[::-1].translate(
+            _BINARY_DIGITS)
+        return list(itertools.compress(
+            self.assets[offset:offset + len(selectors)], selectors))
+
+    def resolve(self, dependables):
+        """Return the assets needed for ``dependables``, as a collection of
+        resources and a list of slots that still need to be filled in.
+
+        Returns ``None`` if some of them are not indexed.
+        """
+        packed = []
+        width = 0
+        start = len(self.assets)
+        end = 0
+        try:
+            for dependable in dependables:
+                offset, bits = self.packed(dependable)
+                length = bits.bit_length()
+                packed.append((offset, bits))
+                width += length
+                start = min(start, offset)
+                end = max(end, offset + length)
+        except KeyError:
+            return None
+        if width >= end - start:
+            closure = 0
+            for offset, bits in packed:
+                closure |= bits << (offset - start)
+            slot_bits = closure & (self.slots >> start)
+            return (
+                self.decode(closure & ~slot_bits, start),
+                self.decode(slot_bits, start))
+        # The closures are far apart, decoding them one by one is cheaper
+        # than decoding all digits in between.
+        assets = set()
+        for offset, bits in packed:
+            assets.update(self.decode(bits, offset))
+        slots = []
+        if self.slots:
+            slots = [asset for asset in assets if isinstance(asset, Slot)]
+            assets.difference_update(slots)
+        return assets, slots
+
+
 class NeededResources:
     """The current selection of needed resources..
 
@@ -759,12 +1223,29 @@ class NeededResources:
       the Resource files to compute versions. Use md5 if you don't trust your
       filesystem.
 
+    :param version_method: The name of the method to compute versions with,
+      registered in the :py:class:`fanstatic.VersionMethodRegistry`:
+      ``mtime`` (the default), ``md5`` or ``content``, which computes the
+      same versions on every server that has the same files. Overrides
+      ``versioning_use_md5``.
+
     :param recompute_hashes: If ``True`` and versioning is enabled, Fanstatic
       will recalculate hash URLs on the fly whenever you make changes, even
       without restarting the server. This is useful during development,
       but slower, so should be turned off during deployment.
       If set to ``False``, the hash URLs will only be
-      calculated once after server startup.
+      calculated once after server startup, or read from the manifests
+      written by ``fanstatic-compile --manifest``.
+
+    :param watch: If ``True`` and ``recompute_hashes`` is enabled, the
+      library directories are watched for changes (see
+      :py:mod:`fanstatic.watcher`), and hash URLs are only recalculated
+      after a change.
+
+    :param recompute_interval: If set and ``recompute_hashes`` is enabled
+      (but ``watch`` is not), hash URLs are recalculated at most once every
+      ``recompute_interval`` seconds, by one thread at a time. Other
+      requests use the previous hash URL meanwhile.
 
     :param base_url: This URL will be prefixed in front of all resource
       URLs. This can be useful if your web framework wants the resources
@@ -801,19 +1282,31 @@ class NeededResources:
     def __init__(self,
                  versioning=False,
                  versioning_use_md5=False,
+                 version_method=None,
                  recompute_hashes=True,
+                 watch=False,
+                 recompute_interval=None,
                  base_url=None,
                  script_name=None,
                  publisher_signature=DEFAULT_SIGNATURE,
                  resources=None,
                  ):
         self._versioning = versioning
-        if versioning_use_md5:
+        if version_method is not None:
+            self._version_method = \
+                fanstatic.registry.VersionMethodRegistry.instance().get(
+                    version_method)
+            if self._version_method is None:
+                raise ConfigurationError(
+                    'No version method found for name %s' % version_method)
+        elif versioning_use_md5:
             self._version_method = fanstatic.checksum.md5
         else:
             self._version_method = fanstatic.checksum.mtime
 
         self._recompute_hashes = recompute_hashes
+        self._watch = watch
+        self._recompute_interval = recompute_interval
         self._base_url = base_url
         self._script_name = script_name
         self._publisher_signature = publisher_signature
@@ -866,30 +1359,64 @@ class NeededResources:
         list than those resources that depend on them.
 
         Resources are also sorted by extension.
+
+        Resolutions are kept in the process-wide ``resolution_cache``, so
+        the same combination of needed resources and slot fillings is
+        only resolved once.
         """
+        key = self.resolution_key()
+        resolved = resolution_cache.get(key)
+        if resolved is None:
+            resolved = frozenset(self._resolve())
+            resolution_cache.set(key, resolved)
+        return set(resolved)
+
+    def _resolve(self):
+        index = fanstatic.get_library_registry().closure_index
+        if index is not None:
+            resolved = index.resolve(self._resources)
+            if resolved is not None:
+                resources, slots = resolved
+                result = set(resources)
+                for slot in slots:
+                    filled_slot = self._fill_slot(slot)
+                    if filled_slot is not None:
+                        result.add(filled_slot)
+                return result
         resources = set()
         for resource in self._resources:
             resources.update(resource.resources)
         return self._fill_slots(resources)
 
+    def resolution_key(self):
+        """Return a hashable key for the current needed resources and
+        slot fillings.
+        """
+        return (frozenset(self._resources), frozenset(self._slots.items()))
+
     def _fill_slots(self, resources):
         result = set()
         for resource in resources:
             if not isinstance(resource, Slot):
                 result.add(resource)
                 continue
-            fill_resource = self._slots.get(resource)
-            if fill_resource is None:
-                if resource.default is not None:
-                    fill_resource = resource.default
-                elif not resource.required:
-                    continue
-                else:
-                    raise SlotError(
-                        "slot %r was required but not filled in" % resource)
-            result.add(FilledSlot(resource, fill_resource))
+            filled_slot = self._fill_slot(resource)
+            if filled_slot is not None:
+                result.add(filled_slot)
         return result
 
+    def _fill_slot(self, slot):
+        fill_resource = self._slots.get(slot)
+        if fill_resource is None:
+            if slot.default is not None:
+                fill_resource = slot.default
+            elif not slot.required:
+                return None
+            else:
+                raise SlotError(
+                    "slot %r was required but not filled in" % slot)
+        return fill_slot(slot, fill_resource)
+
     def clear(self):
         # Clear out any resources "needed" thusfar.
         # XXX or should we rather revert to the list with resources
@@ -916,10 +1443,15 @@ class NeededResources:
             path.append(self._publisher_signature)
         path.append(library.name)
         if self._versioning:
+            watcher = None
+            if self._watch and self._recompute_hashes:
+                watcher = fanstatic.watcher.get_watcher()
             path.append(
                 library.signature(
                     recompute_hashes=self._recompute_hashes,
-                    version_method=self._version_method))
+                    version_method=self._version_method,
+                    watcher=watcher,
+                    interval=self._recompute_interval))
         library_url = self._url_cache[library.name] = '/'.join(path)
         return library_url
 
@@ -952,25 +1484,56 @@ class DummyNeededResources:
 
 thread_local_needed_data = threading.local()
 
+needed_context = contextvars.ContextVar('fanstatic.needed', default=None)
+"""The ``NeededResources`` of the current asyncio task.
+
+When :py:func:`init_needed` is called while an asyncio event loop is
+running, the needed resources are stored in this context variable instead
+of in ``thread_local_needed_data``, so that concurrent requests handled by
+the same thread do not overwrite each other's needed resources.
+"""
+
+
+def _running_async():
+    # Don't import asyncio just to find out it isn't used.
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is None:
+        return False
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
 
 def init_needed(*args, **kw):
     """Initialize a NeededResources object in the thread-local data. Arguments
     are passed verbatim to the NeededResource __init__.
+
+    When called from within a running asyncio event loop, the
+    NeededResources object is stored in the ``needed_context`` context
+    variable of the current task instead.
     """
     registry = fanstatic.get_library_registry()
     registry.prepare()
     needed = NeededResources(*args, **kw)
-    thread_local_needed_data.__dict__[NEEDED] = needed
+    if _running_async():
+        needed_context.set(needed)
+    else:
+        thread_local_needed_data.__dict__[NEEDED] = needed
     return needed
 
 
 def del_needed():
-    """Delete the NeededResources object from the thread-local data to leave a
-    clean environment.
+    """Delete the NeededResources object from the thread-local data (or the
+    context variable of the current task) to leave a clean environment.
 
     This function will silently pass whenever there is no NeededResources
     object in the thread-local in the first place.
     """
+    if needed_context.get() is not None:
+        needed_context.set(None)
+        return
     try:
         del thread_local_needed_data.__dict__[NEEDED]
     except KeyError:
@@ -978,7 +1541,9 @@ def del_needed():
 
 
 def get_needed():
-    needed = thread_local_needed_data.__dict__.get(NEEDED)
+    needed = needed_context.get()
+    if needed is None:
+        needed = thread_local_needed_data.__dict__.get(NEEDED)
     if needed is None:
         # When no NeededResources have been set up, we inject a
         # DummyNeededResources object here.
@@ -1,4 +1,8 @@
+import operator
+
+import fanstatic
 from fanstatic.core import Bundle
+from fanstatic.core import resolution_generation
 
 
 def bundle_resources(resources):
@@ -31,7 +35,15 @@ def rollup_resources(resources):
     """Rollup resources together: if a resource include multiple
     separate ones (i.e. is a rollup) and all the separate ones are
     included the rollup will be used instead.
+
+    If the library registry was prepared, its ``RollupIndex`` is used.
     """
+    index = fanstatic.get_library_registry().rollup_index
+    if index is not None:
+        result = index.rollup(resources)
+        if result is not None:
+            return result
+
     # keep track of rollups: rollup key -> set of resource keys
     potential_rollups = {}
     for resource in resources:
@@ -59,6 +71,128 @@ def rollup_resources(resources):
     return result
 
 
+class RollupIndex:
+    """Index of the rollups of the resources in a number of libraries.
+
+    Every resource that is superseded by a rollup gets a bit, and every
+    rollup is represented by the bitmask of the resources it supersedes.
+    The rollups of a resource are kept sorted from the largest to the
+    smallest, so that rolling up a set of resources is a subset test per
+    candidate rollup.
+
+    The index is built by :py:meth:`LibraryRegistry.prepare`, and rebuilt
+    when the dependency graph changes.
+
+    :param libraries: the libraries whose resources are indexed.
+    """
+
+    def __init__(self, libraries):
+        self.libraries = list(libraries)
+        self._build()
+
+    def _build(self):
+        generation = resolution_generation()
+        bits = {}
+        masks = {}
+        candidates = {}
+        resources = [
+            resource
+            for library in self.libraries
+            for resource in library.known_resources.values()
+            if getattr(resource, 'rollups', None)]
+        # Rollups may supersede resources of libraries that are not
+        # registered, those are indexed as well.
+        for resource in resources:
+            if resource in bits:
+                continue
+            bits[resource] = 1 << len(bits)
+            # The largest rollup wins; of rollups of the same size the
+            # last one defined does.
+            candidates[resource] = tuple(sorted(
+                reversed(resource.rollups),
+                key=lambda rollup: len(rollup.supersedes),
+                reverse=True))
+            for rollup in resource.rollups:
+                resources.extend(rollup.supersedes)
+        for rollups in candidates.values():
+            for rollup in rollups:
+                if rollup in masks:
+                    continue
+                mask = 0
+                for superseded in rollup.supersedes:
+                    mask |= bits[superseded]
+                masks[rollup] = mask
+        # Replace the index in one go for the benefit of other threads.
+        self._index = generation, bits, masks, candidates
+
+    def rollup(self, resources):
+        """Rollup ``resources``, like ``rollup_resources`` does.
+
+        Returns ``None`` if some of the resources have rollups that are
+        not indexed.
+        """
+        generation, bits, masks, candidates = self._index
+        if generation != resolution_generation():
+            self._build()
+            generation, bits, masks, candidates = self._index
+        needed = 0
+        for resource in resources:
+            if resource.rollups:
+                try:
+                    needed |= bits[resource]
+                except KeyError:
+                    return None
+        result = set()
+        for resource in resources:
+            if resource.rollups:
+                for rollup in candidates[resource]:
+                    mask = masks[rollup]
+                    if needed & mask == mask:
+                        result.add(rollup)
+                        break
+                else:
+                    result.add(resource)
+            else:
+                result.add(resource)
+        return result
+
+
+def sort_key(resource):
+    """The key by which resources are sorted, see ``sort_resources``.
+    """
+    return (
+        resource.order,
+        resource.library.library_nr,
+        resource.library.name,
+        resource.dependency_nr,
+        resource.relpath)
+
+
+# The ranks assigned by the last ``rank_resources`` call are in this range.
+# Every call continues after the ranks of the previous one, so ranks from
+# an earlier call (of another registry, or before it was cleared) are told
+# apart and not compared with the current ones.
+_ranking_start = 0
+_ranking_end = 0
+
+
+def rank_resources(resources):
+    """Assign every resource its rank in the sort order of all resources.
+
+    This is done by :py:meth:`LibraryRegistry.prepare`, once all library
+    and dependency numbers are known, so that ``sort_resources`` can sort
+    by a single integer.
+    """
+    global _ranking_start, _ranking_end
+    # Invalidate the previous ranks before assigning new ones.
+    _ranking_start = _ranking_end
+    rank = _ranking_start - 1
+    for rank, resource in enumerate(
+            sorted(resources, key=sort_key), _ranking_start):
+        resource.rank = rank
+    _ranking_end = rank + 1
+
+
 def sort_resources(resources):
     """Sort resources for inclusion on web page.
 
@@ -77,15 +211,23 @@ def sort_resources(resources):
 
     Note this sorting algorithm guarantees a consistent ordering, no
     matter in what order resources were needed.
+
+    Resources that were all ranked by the last ``rank_resources`` call
+    are sorted by their rank. If some resources have no rank, for instance
+    filled slots or resources created after the registry was prepared, or
+    were ranked by an earlier call, the full sort key is used instead.
     """
-    def key(resource):
-        return (
-            resource.order,
-            resource.library.library_nr,
-            resource.library.name,
-            resource.dependency_nr,
-            resource.relpath)
-    return sorted(resources, key=key)
+    resources = list(resources)
+    try:
+        if not resources or \
+                min(map(_rank, resources)) >= _ranking_start:
+            return sorted(resources, key=_rank)
+    except TypeError:
+        pass
+    return sorted(resources, key=sort_key)
+
+
+_rank = operator.attrgetter('rank')
 
 
 class Inclusion:
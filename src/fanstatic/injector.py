@@ -4,12 +4,15 @@ import fanstatic
 from fanstatic import DEBUG
 from fanstatic import MINIFIED
 from fanstatic import ConfigurationError
+from fanstatic.cache import LRUCache
 from fanstatic.config import convert_config
 from fanstatic.inclusion import Inclusion
 
 
 CONTENT_TYPES = ['text/html', 'text/xml', 'application/xhtml+xml']
 
+CHUNK_SIZE = 256 * 1024
+
 
 class Injector:
     """Fanstatic injector WSGI framework component.
@@ -23,6 +26,11 @@ class Injector:
 
     :param app: The WSGI app to wrap with the injector.
 
+    :param stream: If set to ``True``, HTML responses are not buffered:
+      the inclusions are spliced into the response body while it is
+      passed on, provided the injector plugin supports it (see
+      :py:meth:`InjectorPlugin.splicer`).
+
     :param ``**config``: Optional keyword arguments. These are passed
       to :py:class:`NeededResources` when it is constructed. It also
       makes sure that when initialized, it isn't given any
@@ -30,7 +38,7 @@ class Injector:
       ``NeededResources``.
     """
 
-    def __init__(self, app, injector=None, **config):
+    def __init__(self, app, injector=None, stream=False, **config):
         # BBB Backwards compatible: the default behavior was the top
         # bottom injector. It need to be called first since it will
         # remove options from config.
@@ -43,6 +51,7 @@ class Injector:
         self.app = app
         self.config = config
         self.injector = injector
+        self.stream = stream
 
     def __call__(self, environ, start_response):
         request = webob.Request(environ)
@@ -56,45 +65,163 @@ class Injector:
         # environ.
         needed = fanstatic.init_needed(
             script_name=request.environ.get('SCRIPT_NAME'), **self.config)
-
-        # Make sure the needed resource object is put in the WSGI
-        # environment as well, for frameworks that choose to use it
-        # from there.
-        request.environ[fanstatic.NEEDED] = needed
-
-        # Get the response from the wrapped application:
-        response = request.get_response(self.app)
-        # We only continue if the content-type is appropriate.
-        if not (response.content_type and
-                response.content_type.lower() in CONTENT_TYPES):
-            # Clean up after our behinds.
-            fanstatic.del_needed()
-            return response(environ, start_response)
-
-        # The wrapped application may have `needed` resources.
-        if needed.has_resources():
-            # Can't use response.text because there might not be any
-            # charset. body is not unicode.
-            result = self.injector(response.body, needed, request, response)
-            # Reset the body...
-            response.body = b''
-            # Write will propely unfolder the previous application and
-            # call close. Setting response.text or response.body won't do it.
-            response.write(result)
-
-        # Clean up after our behinds.
-        fanstatic.del_needed()
+        try:
+            # Make sure the needed resource object is put in the WSGI
+            # environment as well, for frameworks that choose to use it
+            # from there.
+            request.environ[fanstatic.NEEDED] = needed
+
+            # Get the response from the wrapped application:
+            response = request.get_response(self.app)
+            # We only continue if the content-type is appropriate.
+            if not (response.content_type and
+                    response.content_type.lower() in CONTENT_TYPES):
+                return response(environ, start_response)
+
+            if needed.has_resources():
+                for name, value in self.injector.response_headers(needed):
+                    response.headers.add(name, value)
+
+            if self.stream:
+                splicer = self.injector.splicer(needed)
+                if splicer is not None:
+                    # The needed resources stay around until the body has
+                    # been sent, the application may still need resources
+                    # while producing it.
+                    response.app_iter = SplicedAppIter(
+                        response.app_iter, splicer, cleanup=True)
+                    response.content_length = None
+                    needed = None
+                    return response(environ, start_response)
+
+            # The wrapped application may have `needed` resources.
+            if needed.has_resources():
+                # Can't use response.text because there might not be any
+                # charset. body is not unicode. Reading the body will
+                # properly unfold the previous application and call close.
+                pieces = self.injector.splice(
+                    response.body, needed, request, response)
+                response.app_iter = iter_bytes(pieces)
+                response.content_length = sum(map(len, pieces))
+        finally:
+            # Clean up after our behinds, also if the application raised.
+            if needed is not None:
+                fanstatic.del_needed()
 
         return response(environ, start_response)
 
 
+def iter_bytes(pieces):
+    """Return an app_iter with the ``pieces`` as bytes.
+
+    WSGI requires bytes, so pieces that are memoryviews are copied, but
+    only when they are sent and at most ``CHUNK_SIZE`` bytes at a time.
+    """
+    for piece in pieces:
+        if isinstance(piece, bytes):
+            if piece:
+                yield piece
+            continue
+        for start in range(0, len(piece), CHUNK_SIZE):
+            yield bytes(piece[start:start + CHUNK_SIZE])
+
+
+class Splicer:
+    """Insert bytes before markers in HTML that arrives in chunks.
+
+    :param insertions: a list of ``(marker, render)`` tuples. ``render``
+      is called once the first occurrence of ``marker`` is found, and the
+      bytes it returns are inserted just before it. Markers may be split
+      over several chunks.
+    """
+
+    def __init__(self, insertions):
+        self.pending = list(insertions)
+        self.tail = b''
+
+    def feed(self, chunk):
+        """Return the pieces of the output that are ready once ``chunk``
+        has been received.
+        """
+        if not self.pending:
+            return [chunk]
+        if self.tail:
+            chunk = self.tail + chunk
+        pieces = []
+        position = 0
+        while self.pending:
+            found = None
+            for insertion in self.pending:
+                index = chunk.find(insertion[0], position)
+                if index != -1 and (found is None or index < found[0]):
+                    found = index, insertion
+            if found is None:
+                break
+            index, insertion = found
+            self.pending.remove(insertion)
+            pieces.append(chunk[position:index])
+            pieces.append(insertion[1]())
+            position = index
+        # Hold back the bytes that could be the start of a marker.
+        keep = max((len(marker) - 1 for marker, render in self.pending),
+                   default=0)
+        end = max(len(chunk) - keep, position)
+        pieces.append(chunk[position:end])
+        self.tail = chunk[end:]
+        return pieces
+
+    def close(self):
+        """Return the bytes that were held back.
+        """
+        tail, self.tail = self.tail, b''
+        return tail
+
+
+class SplicedAppIter:
+    """A WSGI app_iter that passes on the chunks of ``app_iter`` through
+    ``splicer``.
+
+    If ``cleanup`` is set, the needed resources are deleted when the
+    app_iter is closed, that is, once the body has been sent.
+    """
+
+    def __init__(self, app_iter, splicer, cleanup=False):
+        self.app_iter = app_iter
+        self.splicer = splicer
+        self.cleanup = cleanup
+
+    def __iter__(self):
+        for chunk in self.app_iter:
+            for piece in self.splicer.feed(chunk):
+                if piece:
+                    yield piece
+        tail = self.splicer.close()
+        if tail:
+            yield tail
+
+    def close(self):
+        try:
+            close = getattr(self.app_iter, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            if self.cleanup:
+                fanstatic.del_needed()
+
+
 class InjectorPlugin:
     """Base class that can be use to write an injector plugin. It will
     take out from the configuration the common options that can be
     used in conjunction with an Inclusion.
+
+    Rendered inclusions can be cached in ``inclusion_cache``, whose size
+    is set with the ``inclusion_cache_size`` option (1000 by default, 0
+    disables the cache).
     """
 
     def __init__(self, options):
+        self.inclusion_cache = LRUCache(
+            maxsize=options.pop('inclusion_cache_size', 1000))
         self._compile = options.pop('compile', False)
         self._bundle = options.pop('bundle', False)
         self._rollup = options.pop('rollup', False)
@@ -117,6 +244,29 @@ class InjectorPlugin:
             compile=self._compile, bundle=self._bundle,
             mode=self._mode, rollup=self._rollup)
 
+    def inclusion_key(self, needed):
+        """Return a key that covers everything the rendered inclusions
+        depend on, or ``None`` if the rendering cannot be cached.
+
+        Apart from the configuration of the plugin itself, these are the
+        needed resources and slot fillings, the state of the dependency
+        graph, and the URLs (including the signatures) of the libraries
+        involved.
+        """
+        if self._compile:
+            # Compilation has to happen for every inclusion.
+            return None
+        resources = needed.resources()
+        libraries = {resource.library for resource in resources}
+        if self._rollup:
+            for resource in resources:
+                libraries.update(rollup.library for rollup in resource.rollups)
+        urls = sorted(needed.library_url(library) for library in libraries)
+        return (
+            fanstatic.core.resolution_generation(),
+            needed.resolution_key(),
+            tuple(urls))
+
     def __call__(self, html, needed, request=None, response=None):
         """ Render the needed resources into the html.
         The request and response arguments are
@@ -124,6 +274,29 @@ class InjectorPlugin:
         """
         raise NotImplementedError
 
+    def splice(self, html, needed, request=None, response=None):
+        """Return the html with the needed resources rendered into it,
+        as a list of pieces (bytes or memoryviews).
+
+        This implementation returns the result of ``__call__`` as a single
+        piece; plugins can override it to avoid copying the html.
+        """
+        return [self(html, needed, request, response)]
+
+    def splicer(self, needed):
+        """Return a :py:class:`Splicer` that injects the needed resources
+        into HTML that is streamed, or ``None`` if the plugin doesn't
+        support streaming.
+        """
+        return None
+
+    def response_headers(self, needed):
+        """Return a list of ``(name, value)`` headers to add to the
+        response, for the resources that are needed when the response
+        starts.
+        """
+        return []
+
 
 class TopBottomInjector(InjectorPlugin):
 
@@ -173,16 +346,157 @@ class TopBottomInjector(InjectorPlugin):
             self.make_inclusion(needed, bottom_resources)
         )
 
-    def __call__(self, html, needed, request=None, response=None):
+    def render_inclusions(self, needed):
+        """Return the rendered top and bottom inclusions as bytes.
+
+        Renderings are cached in ``inclusion_cache``, see
+        :py:meth:`InjectorPlugin.inclusion_key`.
+        """
+        key = self.inclusion_key(needed)
+        if key is not None:
+            rendered = self.inclusion_cache.get(key)
+            if rendered is not None:
+                return rendered
         # seperate inclusions in top and bottom inclusions if this is needed
         top, bottom = self.group(needed)
+        rendered = (
+            top.render().encode() if top else b'',
+            bottom.render().encode() if bottom else b'')
+        if key is not None:
+            self.inclusion_cache.set(key, rendered)
+        return rendered
+
+    def splicer(self, needed):
+        """Return a :py:class:`Splicer` that inserts the top and bottom
+        inclusions before ``</head>`` and ``</body>``.
+
+        Each of them is rendered when its marker is found, so resources
+        that are needed while the page is produced are included, as long
+        as they are needed before their marker is sent.
+
+        Returns ``None`` if a subclass overrides ``__call__``, which then
+        gets the whole page.
+        """
+        if self._overrides_call():
+            return None
+        return Splicer([
+            (b'</head>', lambda: self.render_inclusions(needed)[0]),
+            (b'</body>', lambda: self.render_inclusions(needed)[1]),
+        ])
+
+    def _overrides_call(self):
+        return type(self).__call__ is not TopBottomInjector.__call__
+
+    def splice(self, html, needed, request=None, response=None):
+        """Return the html with the top and bottom inclusions inserted
+        before ``</head>`` and ``</body>``, as a list of memoryviews of the
+        html interleaved with the inclusions.
+
+        The html is scanned once and not copied, unless a subclass
+        overrides ``__call__``: its result is returned as a single piece.
+        """
+        if self._overrides_call():
+            return [self(html, needed, request, response)]
+        return self._splice(html, needed)
+
+    def _splice(self, html, needed):
+        top, bottom = self.render_inclusions(needed)
+        insertions = []
         if top:
-            html = html.replace(
-                b'</head>', f'{top.render()}</head>'.encode(), 1)
+            head = html.find(b'</head>')
+            if head != -1:
+                insertions.append((head, top))
         if bottom:
-            html = html.replace(
-                b'</body>', f'{bottom.render()}</body>'.encode(), 1)
-        return html
+            # Look for the first </body>, normally after </head>.
+            end = insertions[0][0] if insertions else len(html)
+            body = html.find(b'</body>', 0, end)
+            if body == -1 and insertions:
+                body = html.find(b'</body>', end)
+            if body != -1:
+                insertions.append((body, bottom))
+        insertions.sort(key=lambda insertion: insertion[0])
+        view = memoryview(html)
+        pieces = []
+        position = 0
+        for index, inclusion in insertions:
+            pieces.append(view[position:index])
+            pieces.append(inclusion)
+            position = index
+        pieces.append(view[position:])
+        return pieces
+
+    def __call__(self, html, needed, request=None, response=None):
+        return b''.join(self._splice(html, needed))
+
+
+class PreloadInjector(TopBottomInjector):
+    """Injector plugin that adds a ``Link`` header to the response for
+    every resource that is included, so that browsers (or proxies sending
+    ``103 Early Hints``) can start fetching them before the HTML is
+    parsed. The URLs follow bundling and modes like the inclusions do.
+
+    Resources are injected into the HTML like the ``TopBottomInjector``
+    does, unless the ``preload_only`` option is set.
+    """
+
+    name = 'preload'
+
+    preload = {
+        '.css': 'rel=preload; as=style',
+        '.js': 'rel=preload; as=script',
+        '.mjs': 'rel=modulepreload',
+    }
+    """The parameters of the ``Link`` header per resource extension.
+    Resources with other extensions are not preloaded.
+    """
+
+    def __init__(self, options):
+        """
+        :param preload_only: If set to ``True``, only the ``Link`` headers
+          are added, the HTML is left alone.
+        """
+        super().__init__(options)
+        self._preload_only = options.pop('preload_only', False)
+
+    def links(self, needed):
+        """Return the values of the ``Link`` headers for the needed
+        resources.
+
+        These are cached in ``inclusion_cache`` too.
+        """
+        key = self.inclusion_key(needed)
+        if key is not None:
+            key = ('links',) + key
+            links = self.inclusion_cache.get(key)
+            if links is not None:
+                return links
+        links = []
+        # The same inclusions as the ones rendered in the page, so the
+        # URLs match.
+        top, bottom = self.group(needed)
+        for resource in top.resources + bottom.resources:
+            parameters = self.preload.get(resource.ext)
+            if parameters is None:
+                continue
+            url = f'{needed.library_url(resource.library)}/{resource.relpath}'
+            links.append(f'<{url}>; {parameters}')
+        if key is not None:
+            self.inclusion_cache.set(key, links)
+        return links
+
+    def response_headers(self, needed):
+        return [('Link', link) for link in self.links(needed)]
+
+    def _splice(self, html, needed):
+        if self._preload_only:
+            return [html]
+        return super()._splice(html, needed)
+
+    def splicer(self, needed):
+        splicer = super().splicer(needed)
+        if splicer is not None and self._preload_only:
+            return Splicer([])
+        return splicer
 
 
 def make_injector(app, global_config, **local_config):
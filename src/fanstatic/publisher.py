@@ -1,12 +1,23 @@
+import copy
+import email.utils
 import fnmatch
+import hashlib
+import mimetypes
 import os.path
 import time
 
+import webob.byterange
+import webob.datetime_utils
 import webob.dec
 import webob.exc
 import webob.static
 
 import fanstatic
+import fanstatic.cache
+import fanstatic.core
+from fanstatic.compression import is_compressible
+from fanstatic.compression import negotiate
+from fanstatic.config import convert_config
 
 
 MINUTE_IN_SECONDS = 60
@@ -17,12 +28,376 @@ YEAR_IN_SECONDS = DAY_IN_SECONDS * 365
 # arbitrarily define forever as 10 years in the future
 FOREVER = YEAR_IN_SECONDS * 10
 
+# the number of seconds a path that was not found is remembered
+NOT_FOUND_TTL = MINUTE_IN_SECONDS
 
-class BundleApp(webob.static.FileApp):
+# Bundles and compressed files up to this size are kept in memory, larger
+# bundles are streamed from their files and larger files are only served
+# compressed from a precompressed variant.
+BUFFER_LIMIT = 1024 * 1024
 
-    def __init__(self, rootpath, bundle, filenames):
-        # Let FileApp determine content_type and encoding based on bundlename.
-        super().__init__(bundle)
+bundle_cache = fanstatic.cache.LRUCache(maxsize=100)
+"""Process-wide cache of concatenated bundle bodies.
+
+Maps the files of a bundle (and the version in its URL, if any) to the
+stat snapshot of the files, the body they were read into (``None`` for
+bundles larger than :py:data:`BUFFER_LIMIT`), the ``Last-Modified`` and
+``ETag`` values of the response, and a dictionary with the compressed
+variants of the body by content coding.
+"""
+
+compressed_cache = fanstatic.cache.LRUCache(maxsize=100)
+"""Process-wide cache of resource files compressed on the fly.
+
+Maps the path of a file and a content coding to the compressed contents of
+the file, and the modification time and size of the file they were
+compressed from. Only used for files without a precompressed variant.
+"""
+
+
+def bundle_filenames(library, subdir, bundle):
+    """Return the filenames in the ``bundle`` part of a bundle URL.
+
+    Returns ``None`` if the bundle is not valid, i.e. if the filenames
+    are not all known resources of ``library`` in ``subdir``, in the
+    order of their dependency numbers, without duplicates.
+    """
+    dependency_nr = 0
+    filenames = []
+    # Check for duplicate filenames (`dirty bundles`) and check
+    # whether the filenames belong to a Resource definition.
+    for filename in bundle.split(';'):
+        resource = library.known_resources.get(subdir + filename)
+        if resource is None:
+            return None
+        if resource.dependency_nr < dependency_nr:
+            # Invalid bundle, resources in a bundle should be
+            # sorted by dependency_nr.
+            return None
+        dependency_nr = resource.dependency_nr
+        if filename in filenames:
+            # We have a `dirty bundle` request.
+            return None
+        filenames.append(filename)
+    return filenames
+
+
+def library_state(library):
+    """Return what identifies the published contents of ``library``, without
+    computing its signature.
+    """
+    return library.version, library._signature
+
+
+def remember_error(cache, key, error, library=None):
+    """Remember in ``cache`` that ``key`` led to ``error``, until the
+    registry, the dependency graph or the signature of ``library`` changes
+    (or the entry expires).
+
+    Nothing is remembered for a library without a version or a computed
+    signature, such as one whose signature is recomputed on every request
+    during development: its files may change at any time.
+    """
+    if library is not None and library_state(library) == (None, None):
+        return
+    cache.set(key, (
+        type(error), fanstatic.core.resolution_generation(), library,
+        None if library is None else library_state(library)))
+
+
+def known_error(cache, key):
+    """Return the class of the error remembered for ``key`` in ``cache``,
+    or ``None``.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    error, generation, library, state = entry
+    if generation != fanstatic.core.resolution_generation() or \
+            (library is not None and library_state(library) != state):
+        cache.pop(key)
+        return None
+    return error
+
+
+def http_date(timestamp):
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+def not_modified_since(environ, mtime):
+    """Return whether the ``If-Modified-Since`` header of the request is
+    at or after ``mtime``.
+    """
+    since = environ.get('HTTP_IF_MODIFIED_SINCE')
+    if not since:
+        return False
+    since = webob.datetime_utils.parse_date(since)
+    return since is not None and int(mtime) <= since.timestamp()
+
+
+def content_type_headers(filename):
+    """Return the ``Content-Type`` (and ``Content-Encoding``) headers for
+    ``filename``, like ``webob.static.FileApp`` determines them.
+    """
+    content_type, content_encoding = mimetypes.guess_type(filename)
+    if content_type is None:
+        content_type = webob.Response.default_content_type
+    if content_type.startswith('text/') or \
+            content_type == 'application/xml' or \
+            content_type.endswith('+xml'):
+        content_type += '; charset=UTF-8'
+    headers = [('Content-Type', content_type)]
+    if content_encoding:
+        headers.append(('Content-Encoding', content_encoding))
+    return headers
+
+
+def content_range(environ, size, mtime, etag=None):
+    """Return the ``ContentRange`` for a ``Range`` request, with a ``start``
+    of ``None`` if it cannot be satisfied, or ``None`` to serve the whole
+    entity of ``size`` bytes.
+    """
+    range_header = environ.get('HTTP_RANGE')
+    if not range_header:
+        return None
+    if_range = environ.get('HTTP_IF_RANGE')
+    if if_range:
+        if if_range.startswith(('"', 'W/')):
+            if if_range != etag:
+                return None
+        else:
+            date = webob.datetime_utils.parse_date(if_range)
+            if date is None or int(mtime) > date.timestamp():
+                return None
+    requested = webob.byterange.Range.parse(range_header)
+    if requested is None:
+        return None
+    result = requested.content_range(size)
+    if result is None:
+        return webob.byterange.ContentRange(None, None, size)
+    return result
+
+
+def range_not_satisfiable(environ, start_response, content_range, headers):
+    body = (
+        'Requested range not satisfiable: %s' %
+        environ['HTTP_RANGE']).encode('latin-1')
+    start_response('416 Requested Range Not Satisfiable', [
+        ('Content-Length', str(len(body))),
+        ('Content-Range', str(content_range)),
+        ('Content-Type', 'text/plain')] + headers)
+    return [body]
+
+
+def compressed_body(filename, stat, coding, compress):
+    """Return the contents of ``filename`` compressed with ``compress``,
+    using :py:data:`compressed_cache` if the file did not change. Returns
+    ``None`` for files larger than :py:data:`BUFFER_LIMIT`.
+    """
+    if stat.st_size > BUFFER_LIMIT:
+        return None
+    key = (filename, coding)
+    entry = compressed_cache.get(key)
+    if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+        return entry[2]
+    with open(filename, 'rb') as f:
+        body = compress(f.read())
+    compressed_cache.set(key, (stat.st_mtime_ns, stat.st_size, body))
+    return body
+
+
+def iter_files(filenames, sizes, start, stop, separator=b'\n'):
+    """Yield the bytes ``start`` up to ``stop`` of the files, joined by
+    ``separator``, reading at most ``sizes`` bytes of each file.
+    """
+    position = 0
+    for i, (filename, size) in enumerate(zip(filenames, sizes)):
+        if i:
+            if start < position + len(separator) and position < stop:
+                yield separator[
+                    max(start - position, 0):stop - position]
+            position += len(separator)
+        end = position + size
+        if start < end and position < stop:
+            with open(filename, 'rb') as fh:
+                fh.seek(max(start - position, 0))
+                remaining = min(end, stop) - max(start, position)
+                while remaining > 0:
+                    chunk = fh.read(min(webob.static.BLOCK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+        position = end
+        if position >= stop:
+            break
+
+
+def send_file(environ, start_response, file, headers):
+    start_response('200 OK', headers)
+    if environ['REQUEST_METHOD'] == 'HEAD':
+        file.close()
+        return []
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None:
+        return file_wrapper(file, webob.static.BLOCK_SIZE)
+    return webob.static.FileIter(file)
+
+
+class FileApp:
+    """Serve a single file, working directly on the WSGI environment.
+
+    This supports the same as ``webob.static.FileApp`` does: ``GET`` and
+    ``HEAD`` requests, ``If-Modified-Since``, (single) ``Range`` and
+    ``If-Range`` requests, and it uses ``wsgi.file_wrapper`` when the
+    server offers it.
+
+    :param filename: the full path of the file to serve.
+
+    :param compress: if ``True``, a file with a compressible content type
+      is served compressed to clients that accept it. A precompressed
+      ``.br`` or ``.gz`` variant next to the file is used if it is not
+      older than the file, otherwise the file is compressed on the fly.
+    """
+
+    def __init__(self, filename, compress=False):
+        self.filename = filename
+        self.headers = content_type_headers(filename)
+        # Files that have an encoding already are not compressed again.
+        self.compress = (
+            compress and len(self.headers) == 1 and
+            is_compressible(self.headers[0][1]))
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        if method not in ('GET', 'HEAD'):
+            return webob.exc.HTTPMethodNotAllowed(
+                'You cannot %s a file' % method)(environ, start_response)
+        try:
+            stat = os.stat(self.filename)
+        except OSError as e:
+            return webob.exc.HTTPNotFound(
+                comment="Can't open {!r}: {}".format(self.filename, e))(
+                    environ, start_response)
+
+        # Like webob, keep the encoding in all responses.
+        last_modified = [
+            header for header in self.headers
+            if header[0] == 'Content-Encoding'] + [
+            ('Last-Modified', http_date(stat.st_mtime)),
+            ('Accept-Ranges', 'bytes')]
+        if self.compress:
+            last_modified.append(('Vary', 'Accept-Encoding'))
+        if not_modified_since(environ, stat.st_mtime):
+            start_response('304 Not Modified', last_modified)
+            return []
+
+        if self.compress and not environ.get('HTTP_RANGE'):
+            # Ranges are served from the file itself.
+            encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+            if encoding is not None:
+                result = self.send_compressed(
+                    environ, start_response, stat, encoding, last_modified)
+                if result is not None:
+                    return result
+
+        try:
+            file = open(self.filename, 'rb')
+        except OSError as e:
+            return webob.exc.HTTPForbidden(
+                'You are not permitted to view this file (%s)' % e)(
+                    environ, start_response)
+
+        size = stat.st_size
+        range_ = content_range(environ, size, stat.st_mtime)
+        if range_ is not None:
+            if range_.start is None:
+                file.close()
+                return range_not_satisfiable(
+                    environ, start_response, range_, last_modified)
+            start_response('206 Partial Content', [
+                ('Content-Length', str(range_.stop - range_.start)),
+                ('Content-Range', str(range_))] +
+                self.headers[:1] + last_modified)
+            if method == 'HEAD':
+                file.close()
+                return []
+            return webob.static.FileIter(file).app_iter_range(
+                seek=range_.start, limit=range_.stop)
+
+        return send_file(environ, start_response, file, self.headers[:1] + [
+            ('Content-Length', str(size))] + last_modified)
+
+    def send_compressed(self, environ, start_response, stat, encoding,
+                        last_modified):
+        coding, extension, compress = encoding
+        headers = self.headers + [('Content-Encoding', coding)]
+        try:
+            sidecar = os.stat(self.filename + extension)
+        except OSError:
+            sidecar = None
+        if sidecar is not None and sidecar.st_mtime >= stat.st_mtime:
+            try:
+                file = open(self.filename + extension, 'rb')
+            except OSError:
+                pass
+            else:
+                return send_file(environ, start_response, file, headers + [
+                    ('Content-Length', str(sidecar.st_size))] +
+                    last_modified)
+        try:
+            body = compressed_body(self.filename, stat, coding, compress)
+        except OSError as e:
+            return webob.exc.HTTPForbidden(
+                'You are not permitted to view this file (%s)' % e)(
+                    environ, start_response)
+        if body is None:
+            return None
+        start_response('200 OK', headers + [
+            ('Content-Length', str(len(body)))] + last_modified)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        return [body]
+
+
+def bundle_size(snapshot):
+    # The files are joined by newlines.
+    return sum(size for mtime_ns, size in snapshot) + len(snapshot) - 1
+
+
+class BundleApp:
+    """Serve the files of a bundle, joined by newlines.
+
+    The joined body is kept in :py:data:`bundle_cache`. For a bundle
+    served on an unversioned URL, the cached body is checked against a
+    snapshot of the modification times and sizes of the files on every
+    request; a bundle served on a versioned URL (see :py:meth:`versioned`)
+    is not checked again. Conditional requests are answered from the
+    cached ``ETag`` and ``Last-Modified`` values.
+
+    Bundles larger than :py:data:`BUFFER_LIMIT` are not kept in memory,
+    their files are streamed one after the other instead. These are not
+    compressed, and their ``ETag`` is based on the snapshot.
+
+    :param rootpath: the full path of the directory of the files.
+
+    :param bundle: the bundle part of the URL, which determines the
+      content type.
+
+    :param filenames: the filenames of the files in the bundle.
+
+    :param compress: if ``True``, a bundle with a compressible content type
+      is served compressed to clients that accept it. The compressed
+      variants are kept in the cache along with the body.
+    """
+
+    version = None
+
+    def __init__(self, rootpath, bundle, filenames, compress=False):
+        self.headers = content_type_headers(bundle)
+        self.compress = (
+            compress and len(self.headers) == 1 and
+            is_compressible(self.headers[0][1]))
         self.filenames = []
         for filename in filenames:
             fullpath = os.path.join(rootpath, filename)
@@ -32,23 +407,112 @@ class BundleApp(webob.static.FileApp):
             if not os.path.exists(fullpath):
                 raise webob.exc.HTTPNotFound()
             self.filenames.append(fullpath)
+        self.key = (tuple(self.filenames), None)
 
-    @webob.dec.wsgify
-    def __call__(self, req):
-        if req.method not in ('GET', 'HEAD'):
-            return webob.exc.HTTPMethodNotAllowed()
-        mtime = 0
-        contents = []
-        for filename in self.filenames:
-            mtime = max(mtime, os.path.getmtime(filename))
-            fh = open(filename, 'rb')
-            contents.append(fh.read())
-            fh.close()
-        return webob.Response(
-            body=b'\n'.join(contents),
-            last_modified=mtime,
-            **self.kw
-        ).conditional_response_app
+    def versioned(self, version):
+        """Return a copy of the application for a URL with ``version``.
+
+        The files of a versioned URL are assumed not to change, so the
+        cached body of the copy is never checked against the files.
+        """
+        app = copy.copy(self)
+        app.version = version
+        app.key = (self.key[0], version)
+        return app
+
+    def snapshot(self):
+        return tuple(
+            (stat.st_mtime_ns, stat.st_size)
+            for stat in map(os.stat, self.filenames))
+
+    def load(self):
+        """Return the cache entry of the bundle, reading the files if
+        needed.
+        """
+        entry = bundle_cache.get(self.key)
+        if entry is not None and self.version is not None:
+            return entry
+        snapshot = self.snapshot()
+        if entry is not None and entry[0] == snapshot:
+            return entry
+        mtime = max(mtime_ns for mtime_ns, size in snapshot) / 1e9
+        if bundle_size(snapshot) > BUFFER_LIMIT:
+            body = None
+            etag = '"%s"' % hashlib.md5(repr(snapshot).encode()).hexdigest()
+        else:
+            # Take the snapshot before reading, so that a file changing in
+            # the meantime gets it read again on the next request.
+            contents = []
+            for filename in self.filenames:
+                with open(filename, 'rb') as fh:
+                    contents.append(fh.read())
+            body = b'\n'.join(contents)
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+        entry = (snapshot, body, mtime, etag, {})
+        bundle_cache.set(self.key, entry)
+        return entry
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        if method not in ('GET', 'HEAD'):
+            return webob.exc.HTTPMethodNotAllowed()(environ, start_response)
+        try:
+            snapshot, body, mtime, etag, compressed = self.load()
+        except OSError:
+            return webob.exc.HTTPNotFound()(environ, start_response)
+
+        headers = self.headers
+        validators = [('Last-Modified', http_date(mtime))]
+        if self.compress and body is not None:
+            validators.append(('Vary', 'Accept-Encoding'))
+            # Ranges are served from the identity body.
+            encoding = None
+            if not environ.get('HTTP_RANGE'):
+                encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+            if encoding is not None:
+                coding, extension, compress = encoding
+                if coding not in compressed:
+                    compressed[coding] = compress(body)
+                body = compressed[coding]
+                # Each variant has its own entity tag.
+                etag = '{}-{}"'.format(etag[:-1], coding)
+                headers = headers + [('Content-Encoding', coding)]
+        validators.insert(0, ('ETag', etag))
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            not_modified = if_none_match.strip() == '*' or etag in [
+                tag.strip().removeprefix('W/')
+                for tag in if_none_match.split(',')]
+        else:
+            not_modified = not_modified_since(environ, mtime)
+        if not_modified:
+            start_response('304 Not Modified', validators)
+            return []
+
+        validators.append(('Accept-Ranges', 'bytes'))
+        size = bundle_size(snapshot) if body is None else len(body)
+        start, stop = 0, size
+        range_ = content_range(environ, size, mtime, etag)
+        if range_ is not None:
+            if range_.start is None:
+                return range_not_satisfiable(
+                    environ, start_response, range_, validators)
+            start, stop = range_.start, range_.stop
+            status = '206 Partial Content'
+            headers = headers + [('Content-Range', str(range_))]
+        else:
+            status = '200 OK'
+        start_response(status, headers + [
+            ('Content-Length', str(stop - start))] + validators)
+        if method == 'HEAD':
+            return []
+        if body is None:
+            return iter_files(
+                self.filenames, [size for mtime_ns, size in snapshot],
+                start, stop)
+        if range_ is not None:
+            body = body[start:stop]
+        return [body]
 
 
 class LibraryPublisher(webob.static.DirectoryApp):
@@ -62,62 +526,77 @@ class LibraryPublisher(webob.static.DirectoryApp):
     used independently if you need more control.
 
     :param library: The fanstatic library instance.
+
+    :param compress: Whether to serve compressed files to clients that
+      accept them, see :py:class:`FileApp`.
+
+    :param cache_size: The maximum number of applications kept in
+      ``cached_apps``, see :py:class:`Publisher`.
     """
 
-    def __init__(self, library):
+    def __init__(self, library, compress=False, cache_size=1000):
         self.ignores = library.ignores
         self.library = library
-        self.cached_apps = {}
+        self.compress = compress
+        self.cached_apps = fanstatic.cache.LRUCache(maxsize=cache_size)
         super().__init__(library.path)
 
     @webob.dec.wsgify
     def __call__(self, req):
+        return self.find_app(req.path_info)
+
+    def find_app(self, path_info):
+        """Return the WSGI application that serves ``path_info`` in the
+        library.
+
+        Raises a ``webob.exc.HTTPException`` if there is nothing to serve.
+        Applications are cached per path, so the ignores and the file
+        system are only looked at the first time a path is requested.
+        """
+        app = self.cached_apps.get(path_info)
+        if app is not None:
+            return app
+        app = self.make_app(path_info)
+        self.cached_apps.set(path_info, app)
+        return app
+
+    def make_app(self, path_info):
+        segments = path_info.split('/')
         for ignore in self.ignores:
-            if fnmatch.filter(req.path.split('/'), ignore):
+            if fnmatch.filter(segments, ignore):
                 raise webob.exc.HTTPNotFound()
 
-        app = self.cached_apps.get(req.path)
-        if app is None:
-            path = os.path.abspath(
-                os.path.join(self.path, req.path_info.lstrip('/')))
-            if not path.startswith(self.path):
-                raise webob.exc.HTTPForbidden()
-            elif fanstatic.BUNDLE_PREFIX in path:
-
-                # We are handling a bundle request.
-                subdir, bundle = req.path_info.split(
-                    fanstatic.BUNDLE_PREFIX, 1)
-                subdir = subdir.lstrip('/')
-                dependency_nr = 0
-                filenames = []
-                # Check for duplicate filenames (`dirty bundles`) and check
-                # whether the filenames belong to a Resource definition.
-                for filename in bundle.split(';'):
-                    resource = self.library.known_resources.get(
-                        subdir + filename)
-                    if resource is None:
-                        raise webob.exc.HTTPNotFound()
-                    if resource.dependency_nr < dependency_nr:
-                        # Invalid bundle, resources in a bundle should be
-                        # sorted by dependency_nr.
-                        raise webob.exc.HTTPNotFound()
-                    dependency_nr = resource.dependency_nr
-                    if filename in filenames:
-                        # We have a `dirty bundle` request.
-                        raise webob.exc.HTTPNotFound()
-                    else:
-                        filenames.append(filename)
-                # normpath in order to correct the dirname on Windoze.
-                base = os.path.abspath(os.path.join(self.path, subdir))
-                app = BundleApp(base, bundle, filenames)
-            elif os.path.isfile(path):
-                app = self.make_fileapp(path)
-            else:
+        path = os.path.abspath(
+            os.path.join(self.path, path_info.lstrip('/')))
+        if not path.startswith(self.path):
+            raise webob.exc.HTTPForbidden()
+        elif fanstatic.BUNDLE_PREFIX in path:
+
+            # We are handling a bundle request.
+            subdir, bundle = path_info.split(fanstatic.BUNDLE_PREFIX, 1)
+            subdir = subdir.lstrip('/')
+            filenames = bundle_filenames(self.library, subdir, bundle)
+            if filenames is None:
                 raise webob.exc.HTTPNotFound()
-            # Cache the app under the original req.path
-            self.cached_apps[req.path] = app
+            # normpath in order to correct the dirname on Windoze.
+            base = os.path.abspath(os.path.join(self.path, subdir))
+            app = BundleApp(base, bundle, filenames, compress=self.compress)
+        elif os.path.isfile(path):
+            app = self.make_fileapp(path)
+        else:
+            raise webob.exc.HTTPNotFound()
         return app
 
+    def make_fileapp(self, path):
+        """Return the application that serves the file at ``path``, a
+        :py:class:`FileApp` by default.
+
+        The ASGI publisher (see :py:mod:`fanstatic.asgi`) serves the
+        ``filename`` with the ``headers`` of the application itself, so it
+        needs a :py:class:`FileApp`.
+        """
+        return FileApp(path, compress=self.compress)
+
 
 class Publisher:
     """Fanstatic publisher WSGI application.
@@ -131,6 +610,19 @@ class Publisher:
     this will be automatically skipped, and the HTTP response will
     indicate the resource can be cached forever.
 
+    Once a URL has been resolved to a file (or bundle) it is kept in a
+    routing table, so serving it again is a dictionary lookup. The routing
+    table (``routes``) and the applications per library path (the
+    ``cached_apps`` of the :py:class:`LibraryPublisher` instances) are
+    :py:class:`fanstatic.cache.LRUCache` instances, which are safe to use
+    from several threads and report their hits, misses and evictions.
+
+    URLs with nothing to serve are remembered in ``not_found`` for
+    :py:data:`NOT_FOUND_TTL` seconds, or until the registry, the resources
+    or the signature of the library change, so that probing them does not
+    touch the file system every time. Misses in a library without a
+    version or a computed signature are not remembered.
+
     This WSGI component is used automatically by the
     :py:func:`Fanstatic` WSGI framework component, but can also be
     used independently if you need more control.
@@ -138,34 +630,92 @@ class Publisher:
     :param registry: an instance of
       :py:class:`LibraryRegistry` with those resource libraries that
       should be published.
+
+    :param compress: If ``True``, text resources and bundles are served
+      compressed to clients that accept ``br`` or ``gzip`` encoding,
+      from precompressed variants if there are any.
+
+    :param cache_size: The maximum number of URLs kept in the routing
+      table, and of paths kept per library. Bundle URLs can combine the
+      resources of a library in many ways, so these are bounded.
     """
 
-    def __init__(self, registry):
+    def __init__(self, registry, compress=False, cache_size=1000):
         self.registry = registry
+        self.compress = compress
+        self.cache_size = cache_size
         self.directory_publishers = {}
+        # PATH_INFO -> (WSGI application, whether to cache forever)
+        self.routes = fanstatic.cache.LRUCache(maxsize=cache_size)
+        self.not_found = fanstatic.cache.TTLCache(
+            maxsize=cache_size, ttl=NOT_FOUND_TTL)
 
-    @webob.dec.wsgify
-    def __call__(self, request):
-        first = request.path_info_peek()
+    def __call__(self, environ, start_response):
+        path_info = environ.get('PATH_INFO', '')
+        route = self.routes.get(path_info)
+        if route is None:
+            try:
+                route = self.resolve(path_info)
+            except webob.exc.HTTPException as e:
+                return e(environ, start_response)
+
+        app, need_caching = route
+        if not need_caching:
+            return app(environ, start_response)
+
+        def start_response_caching(status, headers, exc_info=None):
+            # set caching for successful responses
+            if status.startswith('20'):
+                headers = [
+                    (name, value) for name, value in headers
+                    if name.lower() not in ('cache-control', 'expires')]
+                headers.append(('Cache-Control', 'max-age=%d' % FOREVER))
+                headers.append(('Expires', http_date(time.time() + FOREVER)))
+            return start_response(status, headers, exc_info)
+
+        return app(environ, start_response_caching)
+
+    def resolve(self, path_info):
+        """Return the route of ``path_info`` (see :py:meth:`route`), which
+        is not in the routing table, and add it there.
+
+        Raises a ``webob.exc.HTTPException`` if there is nothing to serve,
+        which is remembered in ``not_found``.
+        """
+        error = known_error(self.not_found, path_info)
+        if error is not None:
+            raise error()
+        try:
+            route = self.route(path_info)
+        except webob.exc.HTTPException as e:
+            library = self.registry.get(
+                path_info.lstrip('/').partition('/')[0])
+            remember_error(self.not_found, path_info, e, library)
+            raise
+        self.routes.set(path_info, route)
+        return route
+
+    def route(self, path_info):
+        """Return the WSGI application that serves ``path_info`` and whether
+        its response can be cached forever.
+
+        Raises a ``webob.exc.HTTPException`` if there is nothing to serve.
+        """
+        library_name, sep, rest = path_info.lstrip('/').partition('/')
         # Don't allow requests on just publisher
-        if first is None:
-            raise webob.exc.HTTPNotFound()
-
-        library_name = request.path_info_pop()
-        # don't allow requests on just publisher
         if library_name == '':
             raise webob.exc.HTTPNotFound()
+        rest = sep + rest
 
-        # pop version if it's there
-        potential_version = request.path_info_peek()
-        if potential_version is not None and \
-                potential_version.startswith(fanstatic.VERSION_PREFIX):
-            request.path_info_pop()
+        # skip the version if it's there
+        if rest.startswith('/' + fanstatic.VERSION_PREFIX):
+            version, sep, rest = rest[1:].partition('/')
+            rest = sep + rest
             need_caching = True
         else:
             need_caching = False
 
-        if request.path_info == '':
+        if rest == '':
             raise webob.exc.HTTPNotFound()
 
         directory_publisher = self.directory_publishers.get(library_name)
@@ -175,16 +725,16 @@ class Publisher:
                 # unknown library
                 raise webob.exc.HTTPNotFound()
             self.registry.prepare()
-            directory_publisher = self.directory_publishers[library_name] = \
-                LibraryPublisher(library)
+            # setdefault, so that concurrent requests share one publisher.
+            directory_publisher = self.directory_publishers.setdefault(
+                library_name, LibraryPublisher(
+                    library, compress=self.compress,
+                    cache_size=self.cache_size))
 
-        # now delegate publishing to the directory publisher
-        response = request.get_response(directory_publisher)
-        # set caching when needed and for successful responses
-        if need_caching and response.status.startswith('20'):
-            response.cache_control.max_age = FOREVER
-            response.expires = time.time() + FOREVER
-        return response
+        app = directory_publisher.find_app(rest)
+        if need_caching and isinstance(app, BundleApp):
+            app = app.versioned(version)
+        return app, need_caching
 
 
 class Delegator:
@@ -218,22 +768,26 @@ class Delegator:
         self.trigger = '/%s/' % self.publisher_signature
 
     def is_resource(self, request):
-        return len(request.path_info.split(self.trigger)) > 1
+        return self.trigger in request.path_info
 
     def __call__(self, environ, start_response):
-        request = webob.Request(environ)
-        if not self.is_resource(request):
+        path_info = environ.get('PATH_INFO', '')
+        if self.trigger not in path_info:
             # the trigger segment is not in the URL, so we delegate
             # to the original application
             return self.app(environ, start_response)
         # the trigger is in there, so let whatever is behind the
         # trigger be handled by the publisher
-        ignored = request.path_info_pop()
-        while ignored != self.publisher_signature:
-            ignored = request.path_info_pop()
+        prefix, path_info = path_info.split(self.trigger, 1)
+        environ['SCRIPT_NAME'] = (
+            environ.get('SCRIPT_NAME', '') + prefix + self.trigger[:-1])
+        environ['PATH_INFO'] = '/' + path_info
         return self.publisher(environ, start_response)
 
 
-def make_publisher(global_config):
+def make_publisher(global_config, **local_config):
+    local_config = convert_config(local_config)
+    if 'publisher_cache_size' in local_config:
+        local_config['cache_size'] = local_config.pop('publisher_cache_size')
     registry = fanstatic.get_library_registry()
-    return Publisher(registry)
+    return Publisher(registry, **local_config)
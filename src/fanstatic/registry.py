@@ -3,6 +3,8 @@ import threading
 
 import packaging.version
 
+import fanstatic
+import fanstatic.checksum
 from fanstatic.compiler import NullCompiler
 
 
@@ -20,13 +22,14 @@ class Registry(dict):
     def add(self, item):
         self[item.name] = item
 
-    def load_items_from_entry_points(self):
+    def entry_points(self):
         try:
-            entry_points = importlib.metadata.entry_points(
-                group=self.ENTRY_POINT)
+            return importlib.metadata.entry_points(group=self.ENTRY_POINT)
         except TypeError:  # Python < 3.10
-            entry_points = importlib.metadata.entry_points()[self.ENTRY_POINT]
-        for entry_point in entry_points:
+            return importlib.metadata.entry_points()[self.ENTRY_POINT]
+
+    def load_items_from_entry_points(self):
+        for entry_point in self.entry_points():
             self.add(self.make_item_from_entry_point(entry_point))
 
     def make_item_from_entry_point(self, entry_point):
@@ -59,6 +62,16 @@ class LibraryRegistry(Registry):
 
     prepared = False
 
+    closure_index = None
+    """The :py:class:`fanstatic.core.ClosureIndex` of the registered
+    libraries, available once the registry is prepared.
+    """
+
+    rollup_index = None
+    """The :py:class:`fanstatic.inclusion.RollupIndex` of the registered
+    libraries, available once the registry is prepared.
+    """
+
     def prepare(self):
         if self.prepared:
             return
@@ -66,12 +79,23 @@ class LibraryRegistry(Registry):
         try:
             if self.prepared:
                 return
+            fanstatic.core.compute_deferred_closures()
             for library in self.values():
                 library.init_library_nr()
             for library in sorted(self.values(), key=lambda l_: l_.library_nr):
                 for asset in library.known_assets:
                     asset.init_dependency_nr()
+            fanstatic.inclusion.rank_resources(
+                resource
+                for library in self.values()
+                for resource in library.known_resources.values()
+                # Skip resources whose construction failed half way.
+                if hasattr(resource, 'order'))
+            libraries = sorted(self.values(), key=lambda l_: l_.library_nr)
+            self.closure_index = fanstatic.core.ClosureIndex(libraries)
+            self.rollup_index = fanstatic.inclusion.RollupIndex(libraries)
             self.prepared = True
+            fanstatic.core.invalidate_resolution_cache()
         finally:
             prepare_lock.release()
 
@@ -79,10 +103,14 @@ class LibraryRegistry(Registry):
         if self.prepared:
             raise ValueError('Registry initialized.')
         super().__setitem__(key, value)
+        fanstatic.core.invalidate_resolution_cache()
 
     def clear(self):
         super().clear()
         self.prepared = False
+        self.closure_index = None
+        self.rollup_index = None
+        fanstatic.core.invalidate_resolution_cache()
 
     def make_item_from_entry_point(self, entry_point):
         item = super().make_item_from_entry_point(
@@ -125,3 +153,41 @@ class MinifierRegistry(Registry):
 class InjectorRegistry(Registry):
 
     ENTRY_POINT = 'fanstatic.injectors'
+
+
+class VersionMethodRegistry(Registry):
+    """A dictionary-like registry of version methods.
+
+    A version method is a callable that takes the path of a library
+    directory and returns a signature of its contents, used in versioned
+    URLs. ``mtime``, ``md5`` and ``content`` from :py:mod:`fanstatic.checksum`
+    are registered first. Other methods can be added with ``add``, or
+    through the ``fanstatic.version_methods`` entry point under the name of
+    the entry point.
+
+    :param items: a mapping (or a sequence of pairs) of names to version
+      methods, which can replace the built-in ones
+    """
+
+    ENTRY_POINT = 'fanstatic.version_methods'
+
+    def __init__(self, items=()):
+        super().__init__((
+            fanstatic.checksum.mtime,
+            fanstatic.checksum.md5,
+            fanstatic.checksum.content))
+        self.update(items)
+
+    def add(self, item, name=None):
+        """Register the version method ``item`` under ``name``, by default
+        its ``__name__``.
+        """
+        if name is None:
+            name = item.__name__
+        self[name] = item
+
+    def load_items_from_entry_points(self):
+        for entry_point in self.entry_points():
+            self.add(
+                self.make_item_from_entry_point(entry_point),
+                entry_point.name)
@@ -1,6 +1,8 @@
 from fanstatic import get_library_registry
 from fanstatic import set_auto_register_library
+from fanstatic import set_deferred_graph_construction
 from fanstatic import set_resource_file_existence_checking
+from fanstatic.checksum import set_digest_cache
 from fanstatic.core import NEEDED
 from fanstatic.core import thread_local_needed_data
 
@@ -11,8 +13,11 @@ def pytest_runtest_setup(item):
     # Reset the registry before each test.
     get_library_registry().clear()
     thread_local_needed_data.__dict__.pop(NEEDED, None)
+    # Don't keep digests of test files around.
+    set_digest_cache(None)
 
 
 def pytest_runtest_teardown(item):
     set_resource_file_existence_checking(True)
     set_auto_register_library(False)
+    set_deferred_graph_construction(False)
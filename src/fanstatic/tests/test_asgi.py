@@ -0,0 +1,338 @@
+import asyncio
+import email.utils
+
+import pytest
+
+from fanstatic import NEEDED
+from fanstatic import Library
+from fanstatic import LibraryRegistry
+from fanstatic import Resource
+from fanstatic import get_library_registry
+from fanstatic import get_needed
+from fanstatic.asgi import Delegator
+from fanstatic.asgi import Fanstatic
+from fanstatic.asgi import Injector
+from fanstatic.asgi import Publisher
+from fanstatic.publisher import FOREVER
+
+
+def call(app, path, method='GET', headers=(), root_path=''):
+    """Call the ASGI ``app`` and return the status, headers and body of the
+    response.
+    """
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'root_path': root_path,
+        'headers': [
+            (key.lower().encode(), value.encode()) for key, value in headers],
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    assert start['type'] == 'http.response.start'
+    assert not messages[-1].get('more_body', False)
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+    return (
+        start['status'],
+        {key.decode(): value.decode() for key, value in start['headers']},
+        body)
+
+
+def html_app(*resources, content_type=b'text/html', chunks=None):
+    if chunks is None:
+        chunks = [b'<html><head></head><body></body></html>']
+
+    async def app(scope, receive, send):
+        assert scope[NEEDED] is get_needed()
+        for resource in resources:
+            resource.need()
+        await send({
+            'type': 'http.response.start', 'status': 200,
+            'headers': [
+                (b'content-type', content_type),
+                (b'content-length', b'%d' % sum(map(len, chunks)))]})
+        for i, chunk in enumerate(chunks):
+            await asyncio.sleep(0)
+            await send({
+                'type': 'http.response.body', 'body': chunk,
+                'more_body': i < len(chunks) - 1})
+    return app
+
+
+def test_inject():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+    x2 = Resource(foo, 'b.css')
+    y1 = Resource(foo, 'c.js', depends=[x1, x2])
+
+    app = Injector(html_app(y1), base_url='http://testapp')
+    status, headers, body = call(app, '/')
+    assert status == 200
+    assert body == b'''\
+<html><head><link rel="stylesheet" type="text/css" href="http://testapp/fanstatic/foo/b.css" />
+<script type="text/javascript" src="http://testapp/fanstatic/foo/a.js"></script>
+<script type="text/javascript" src="http://testapp/fanstatic/foo/c.js"></script></head><body></body></html>'''  # noqa: E501 line too long
+    assert headers['content-length'] == str(len(body))
+    # The needed resources are gone after the request.
+    assert not get_needed().has_resources()
+
+
+def test_inject_chunked_body():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+
+    app = Injector(
+        html_app(x1, chunks=[b'<html><he', b'ad></head><bo', b'dy></body>']))
+    status, headers, body = call(app, '/', root_path='/root')
+    assert body == (
+        b'<html><head><script type="text/javascript" '
+        b'src="/root/fanstatic/foo/a.js"></script></head>'
+        b'<body></body>')
+
+
+def test_no_inject_into_non_html():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+
+    app = Injector(html_app(x1, content_type=b'text/plain'))
+    status, headers, body = call(app, '/')
+    assert body == b'<html><head></head><body></body></html>'
+
+    app = Injector(html_app(x1))
+    status, headers, body = call(app, '/', method='HEAD')
+    assert body == b'<html><head></head><body></body></html>'
+
+
+def test_needed_deleted_after_failing_request():
+    async def failing_app(scope, receive, send):
+        raise ValueError('Boom')
+
+    with pytest.raises(ValueError):
+        call(Injector(failing_app), '/')
+    assert not get_needed().has_resources()
+
+
+def test_concurrent_requests():
+    foo = Library('foo', '')
+    resources = [Resource(foo, f'r{i}.js') for i in range(50)]
+    app = Injector(lambda scope, receive, send: html_app(
+        resources[int(scope['path'][1:])])(scope, receive, send))
+
+    async def request(i):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+        await app(
+            {'type': 'http', 'method': 'GET', 'path': f'/{i}',
+             'headers': []}, None, send)
+        return b''.join(message.get('body', b'') for message in messages)
+
+    async def serve():
+        return await asyncio.gather(*map(request, range(len(resources))))
+
+    for i, body in enumerate(asyncio.run(serve())):
+        assert body.count(b'<script') == 1
+        assert b'/r%d.js' % i in body
+
+
+@pytest.fixture
+def library(tmpdir):
+    foo_library_dir = tmpdir.mkdir('foo')
+    tmpdir.join('foo').join('test.js').write('/* a test */')
+    tmpdir.join('foo').join('test2.js').write('/* another test */')
+    tmpdir.join('foo').join('.svn').write('secret')
+    library = Library('foo', foo_library_dir.strpath, ignores=['.svn'])
+    Resource(library, 'test.js')
+    Resource(library, 'test2.js')
+    return library
+
+
+def test_publisher(library):
+    app = Publisher(LibraryRegistry([library]))
+
+    status, headers, body = call(app, '/foo/test.js')
+    assert status == 200
+    assert body == b'/* a test */'
+    assert headers['content-length'] == '12'
+    assert headers['content-type'].endswith('javascript; charset=UTF-8')
+    assert 'cache-control' not in headers
+
+    status, headers, body = call(app, '/foo/test.js', method='HEAD')
+    assert status == 200
+    assert body == b''
+    assert headers['content-length'] == '12'
+
+    status, headers, body = call(app, '/foo/test.js', method='POST')
+    assert status == 405
+
+
+def test_publisher_not_found(library):
+    app = Publisher(LibraryRegistry([library]))
+    for path in ['', '/', '/foo', '/bar/test.js', '/foo/other.js',
+                 '/foo/:version:1', '/foo/.svn']:
+        status, headers, body = call(app, path)
+        assert status == 404, path
+
+    # Like the WSGI publisher.
+    for path in ['/foo/', '/foo/../../secret.js']:
+        status, headers, body = call(app, path)
+        assert status == 403, path
+
+    # Ignores are matched inside the library, not against the root path.
+    status, headers, body = call(app, '/foo/test.js', root_path='/.svn')
+    assert status == 200
+
+    # Routes and misses are kept in bounded caches.
+    assert app.routes.get('/foo/test.js') is not None
+    assert app.not_found.get('/bar/test.js') is not None
+
+
+def test_publisher_version(library):
+    app = Publisher(LibraryRegistry([library]))
+    status, headers, body = call(app, '/foo/:version:something/test.js')
+    assert body == b'/* a test */'
+    assert headers['cache-control'] == 'max-age=%d' % FOREVER
+    assert 'expires' in headers
+
+
+def test_publisher_if_modified_since(library):
+    app = Publisher(LibraryRegistry([library]))
+    status, headers, body = call(app, '/foo/test.js')
+    last_modified = headers['last-modified']
+
+    status, headers, body = call(
+        app, '/foo/test.js', headers=[('If-Modified-Since', last_modified)])
+    assert status == 304
+    assert body == b''
+
+    earlier = email.utils.formatdate(
+        email.utils.parsedate_to_datetime(last_modified).timestamp() - 60,
+        usegmt=True)
+    status, headers, body = call(
+        app, '/foo/test.js', headers=[('If-Modified-Since', earlier)])
+    assert status == 200
+
+
+def test_publisher_bundle(library):
+    app = Publisher(LibraryRegistry([library]))
+    status, headers, body = call(app, '/foo/:bundle:test.js;test2.js')
+    assert status == 200
+    assert body == b'/* a test */\n/* another test */'
+    assert headers['content-length'] == str(len(body))
+
+    # Dirty bundles are not served.
+    status, headers, body = call(app, '/foo/:bundle:test.js;test.js')
+    assert status == 404
+
+
+def test_publisher_large_files(library, monkeypatch):
+    import fanstatic.publisher
+
+    monkeypatch.setattr(fanstatic.publisher, 'BUFFER_LIMIT', 5)
+    app = Publisher(LibraryRegistry([library]))
+    status, headers, body = call(app, '/foo/:bundle:test.js;test2.js')
+    assert status == 200
+    assert body == b'/* a test */\n/* another test */'
+    assert headers['content-length'] == str(len(body))
+
+
+def test_fanstatic(library):
+    registry = get_library_registry()
+    registry.add(library)
+    test_js = library.known_resources['test.js']
+    app = Fanstatic(html_app(test_js), versioning=True)
+
+    status, headers, body = call(app, '/')
+    url = body.split(b'src="')[1].split(b'"')[0].decode()
+    assert url.startswith('/fanstatic/foo/:version:')
+
+    status, headers, body = call(app, url)
+    assert body == b'/* a test */'
+    assert headers['cache-control'] == 'max-age=%d' % FOREVER
+
+
+def test_fanstatic_publisher_options():
+    from fanstatic import ConfigurationError
+
+    # The same options as the WSGI component.
+    app = Fanstatic(html_app(), publisher_cache_size=10, compress=False)
+    assert app.publisher.routes.maxsize == 10
+    with pytest.raises(ConfigurationError):
+        Fanstatic(html_app(), compress=True)
+
+
+def test_delegator():
+    paths = []
+
+    async def app(scope, receive, send):
+        paths.append(('app', scope['root_path'], scope['path']))
+
+    async def publisher(scope, receive, send):
+        paths.append(('publisher', scope['root_path'], scope['path']))
+
+    delegator = Delegator(app, publisher)
+    for path in ['/', '/foo/fanstatic', '/foo/fanstatic/bar/baz.js']:
+        asyncio.run(delegator(
+            {'type': 'http', 'path': path, 'root_path': '/root'},
+            None, None))
+    assert paths == [
+        ('app', '/root', '/'),
+        ('app', '/root', '/foo/fanstatic'),
+        ('publisher', '/root/foo/fanstatic', '/bar/baz.js')]
+
+
+def test_inject_streaming():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+
+    app = Injector(
+        html_app(x1, chunks=[b'<html><he', b'ad></he', b'ad><body>']),
+        stream=True)
+    status, headers, body = call(app, '/')
+    assert body == (
+        b'<html><head><script type="text/javascript" '
+        b'src="/fanstatic/foo/a.js"></script></head><body>')
+    assert 'content-length' not in headers
+
+
+def test_inject_overridden_call():
+    from fanstatic.injector import TopBottomInjector
+
+    class BodyClassInjector(TopBottomInjector):
+        def __call__(self, html, needed, request=None, response=None):
+            html = super().__call__(html, needed, request, response)
+            return html.replace(b'<body>', b'<body class="x">')
+
+    x1 = Resource(Library('foo', ''), 'a.js')
+    app = Injector(html_app(x1), injector=BodyClassInjector({}))
+    status, headers, body = call(app, '/')
+    assert body == (
+        b'<html><head><script type="text/javascript" '
+        b'src="/fanstatic/foo/a.js"></script></head>'
+        b'<body class="x"></body></html>')
+
+
+def test_preload_injector():
+    from fanstatic.injector import PreloadInjector
+
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+
+    for stream in [False, True]:
+        app = Injector(
+            html_app(x1), injector=PreloadInjector({'preload_only': True}),
+            stream=stream)
+        status, headers, body = call(app, '/')
+        assert headers['link'] == (
+            '</fanstatic/foo/a.js>; rel=preload; as=script')
+        assert body == b'<html><head></head><body></body></html>'
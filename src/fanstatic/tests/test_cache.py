@@ -0,0 +1,64 @@
+from fanstatic.cache import LRUCache
+from fanstatic.cache import TTLCache
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    assert cache.get('a') is None
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    # 'b' is now the least recently used entry.
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert 'a' in cache
+    assert 'c' in cache
+    assert len(cache) == 2
+    assert cache.stats() == {
+        'hits': 1, 'misses': 1, 'evictions': 1, 'size': 2, 'maxsize': 2}
+
+
+def test_lru_cache_pop_and_clear():
+    cache = LRUCache()
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.pop('a') == 1
+    assert cache.pop('a', 'gone') == 'gone'
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.get('b', 'default') == 'default'
+
+
+def test_lru_cache_disabled():
+    cache = LRUCache(maxsize=0)
+    cache.set('a', 1)
+    assert 'a' not in cache
+    assert cache.get('a') is None
+
+
+def test_lru_cache_unbounded():
+    cache = LRUCache(maxsize=None)
+    for i in range(2000):
+        cache.set(i, i)
+    assert len(cache) == 2000
+    assert cache.evictions == 0
+
+
+def test_ttl_cache(monkeypatch):
+    import time
+
+    now = 1000.0
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    now += 9
+    assert cache.get('a') == 1
+    now += 1
+    assert cache.get('a') is None
+    assert 'a' not in cache
+    cache.set('b', 2)
+    assert cache.pop('b') == 2
+    assert cache.pop('b', 'gone') == 'gone'
+    assert cache.stats() == {
+        'hits': 2, 'misses': 1, 'evictions': 0, 'size': 0, 'maxsize': 2}
@@ -1,3 +1,4 @@
+import json
 import os
 import shutil
 import time
@@ -5,10 +6,15 @@ from importlib.resources import as_file
 from importlib.resources import files
 
 from fanstatic.checksum import IGNORED_EXTENSIONS
+from fanstatic.checksum import MANIFEST
 from fanstatic.checksum import VCS_NAMES
+from fanstatic.checksum import content
+from fanstatic.checksum import file_digest
 from fanstatic.checksum import list_directory
 from fanstatic.checksum import md5
 from fanstatic.checksum import mtime
+from fanstatic.checksum import read_manifest
+from fanstatic.checksum import write_manifest
 
 
 def _copy_testdata(tmpdir):
@@ -218,3 +224,124 @@ def test_md5(tmpdir):
     found = list(list_directory(testdata_path))
     assert sorted(found) == sorted(expected)
     assert md5(testdata_path) != md5_start
+
+
+def test_md5_digest_cache(tmpdir, monkeypatch):
+    import fanstatic.checksum
+    from fanstatic.checksum import set_digest_cache
+
+    # Read the files in a thread pool, also on a single CPU.
+    monkeypatch.setattr(fanstatic.checksum, 'MAX_WORKERS', 4)
+    testdata_path = str(_copy_testdata(tmpdir))
+    md5_start = md5(testdata_path)
+
+    read = []
+    file_digest = fanstatic.checksum.file_digest
+
+    def log_file_digest(path):
+        read.append(os.path.basename(path))
+        return file_digest(path)
+    monkeypatch.setattr(fanstatic.checksum, 'file_digest', log_file_digest)
+
+    cache = tmpdir.join('cache').join('digests.json')
+    set_digest_cache(cache.strpath)
+    assert md5(testdata_path) == md5_start
+    assert sorted(read) == [
+        'MANIFEST.in', '__init__.py', 'resources.py', 'setup.py',
+        'style.css']
+    assert cache.check()
+
+    # A new process does not read the files again, except the changed one.
+    del read[:]
+    set_digest_cache(cache.strpath)
+    assert md5(testdata_path) == md5_start
+    assert read == []
+    tmpdir.join('/SomePackage/setup.py').write('changed')
+    set_digest_cache(cache.strpath)
+    md5_changed = md5(testdata_path)
+    assert md5_changed != md5_start
+    assert read == ['setup.py']
+
+    # The entries of files that are gone are dropped from the cache file.
+    removed = os.path.join(testdata_path, 'MANIFEST.in')
+    assert removed in json.loads(cache.read())
+    os.remove(removed)
+    set_digest_cache(cache.strpath)
+    md5(testdata_path)
+    assert removed not in json.loads(cache.read())
+
+    # A broken cache file is ignored.
+    cache.write('{broken')
+    set_digest_cache(cache.strpath)
+    md5_removed = md5(testdata_path)
+    assert md5_removed != md5_changed
+    assert md5(testdata_path) == md5_removed
+    set_digest_cache(None)
+
+
+def test_digest_cache_opt_in(monkeypatch):
+    from fanstatic.checksum import default_digest_cache
+    monkeypatch.delenv('FANSTATIC_DIGEST_CACHE', raising=False)
+    assert default_digest_cache() is None
+    monkeypatch.setenv('FANSTATIC_DIGEST_CACHE', '')
+    assert default_digest_cache() is None
+    monkeypatch.setenv('FANSTATIC_DIGEST_CACHE', '/tmp/digests.json')
+    assert default_digest_cache() == '/tmp/digests.json'
+
+
+def test_content(tmpdir):
+    one = tmpdir.mkdir('one')
+    one.join('a.js').write('a')
+    one.mkdir('sub').join('b.css').write('b')
+    two = tmpdir.mkdir('two')
+    two.join('a.js').write('a')
+    two.mkdir('sub').join('b.css').write('b')
+    two.mkdir('empty')
+    os.utime(two.join('a.js').strpath, (0, 0))
+
+    # Other locations and modification times give the same checksum.
+    content_start = content(one.strpath)
+    assert content(two.strpath) == content_start
+
+    # Precompressed variants are left out, other files are not.
+    one.join('a.js.gz').write('compressed')
+    assert content(one.strpath) == content_start
+    one.join('c.gz').write('compressed')
+    assert content(one.strpath) != content_start
+    one.join('c.gz').remove()
+
+    one.join('a.js').write('changed')
+    assert content(one.strpath) != content_start
+    one.join('a.js').write('a')
+    assert content(one.strpath) == content_start
+    one.join('sub', 'b.css').rename(one.join('b.css'))
+    assert content(one.strpath) != content_start
+
+
+def test_manifest(tmpdir):
+    testdata_path = str(_copy_testdata(tmpdir))
+    assert read_manifest(testdata_path) is None
+    md5_start = md5(testdata_path)
+
+    target = write_manifest(testdata_path)
+    assert target == os.path.join(testdata_path, MANIFEST)
+    assert read_manifest(testdata_path) == {'signature': md5_start}
+    # The manifest is not part of the signature.
+    assert md5(testdata_path) == md5_start
+    assert target not in list(list_directory(testdata_path))
+
+    write_manifest(testdata_path, files=True)
+    manifest = read_manifest(testdata_path)
+    assert manifest['signature'] == md5_start
+    assert sorted(manifest['files']) == [
+        'MANIFEST.in', 'setup.py', 'src/somepackage/__init__.py',
+        'src/somepackage/resources.py',
+        'src/somepackage/resources/style.css']
+    assert manifest['files']['setup.py'] == \
+        file_digest(os.path.join(testdata_path, 'setup.py'))
+
+    # Broken manifests are ignored.
+    tmpdir.join('SomePackage', MANIFEST).write('{broken')
+    assert read_manifest(testdata_path) is None
+    tmpdir.join('SomePackage', MANIFEST).write('{"files": {}}')
+    assert read_manifest(testdata_path) is None
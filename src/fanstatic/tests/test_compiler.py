@@ -580,6 +580,69 @@ def test_console_script_collects_resources_from_package(
     assert calls[0] == (mypackage.style, True)
 
 
+def test_compile_resources_writes_compressed_variants(tmpdir, libraries):
+    import gzip
+
+    from fanstatic import get_library_registry
+    from fanstatic.compression import ENCODINGS
+
+    lib = Library('other', tmpdir.strpath)
+    Resource(lib, 'a.js')
+    Resource(lib, 'tiny.css')
+    Resource(lib, 'missing.js')
+    tmpdir.join('a.js').write('var a = 1;\n' * 100)
+    tmpdir.join('tiny.css').write('a{}')
+    get_library_registry().add(lib)
+
+    fanstatic.compiler._compile_resources(
+        'fanstatic.tests', compress=False)
+    assert sorted(os.listdir(tmpdir.strpath)) == ['a.js', 'tiny.css']
+
+    fanstatic.compiler._compile_resources('fanstatic.tests', compress=True)
+    # Variants that are not smaller are not written.
+    assert sorted(os.listdir(tmpdir.strpath)) == sorted(
+        ['a.js', 'tiny.css'] +
+        ['a.js' + extension for coding, extension, compress in ENCODINGS])
+    assert gzip.decompress(tmpdir.join('a.js.gz').read_binary()) == \
+        b'var a = 1;\n' * 100
+
+    # Also for libraries with a version.
+    versioned_dir = tmpdir.mkdir('v')
+    versioned = Library('versioned', versioned_dir.strpath, version='1')
+    Resource(versioned, 'b.js')
+    versioned_dir.join('b.js').write('var b = 1;\n' * 100)
+    get_library_registry().add(versioned)
+    fanstatic.compiler._compile_resources('fanstatic.tests', compress=True)
+    assert versioned_dir.join('b.js.gz').check()
+
+
+def test_compile_resources_writes_manifest(tmpdir, libraries):
+    from fanstatic import get_library_registry
+    from fanstatic.checksum import MANIFEST
+    from fanstatic.checksum import md5
+    from fanstatic.checksum import read_manifest
+
+    lib = Library('other', tmpdir.strpath)
+    Resource(lib, 'a.js')
+    tmpdir.join('a.js').write('var a = 1;\n')
+    versioned = Library('versioned', tmpdir.mkdir('v').strpath, version='1')
+    get_library_registry().add(lib)
+    get_library_registry().add(versioned)
+
+    fanstatic.compiler._compile_resources('fanstatic.tests')
+    assert not tmpdir.join(MANIFEST).check()
+
+    fanstatic.compiler._compile_resources('fanstatic.tests', manifest=True)
+    assert read_manifest(tmpdir.strpath) == {
+        'signature': md5(tmpdir.strpath)}
+    # Libraries with a version do not need a manifest.
+    assert not tmpdir.join('v', MANIFEST).check()
+
+    fanstatic.compiler._compile_resources(
+        'fanstatic.tests', manifest_files=True)
+    assert sorted(read_manifest(tmpdir.strpath)['files']) == ['a.js']
+
+
 def test_custom_sdist_command_runs_compiler_beforehand(tmpdir, monkeypatch):
     import os
     import re
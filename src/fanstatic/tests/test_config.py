@@ -10,6 +10,7 @@ def test_convert_config():
         'bottom': 'True',
         'force_bottom': 'False',
         'rollup': 0,
+        'recompute_interval': '2.5',
         'somethingelse': 'True',
     }
     assert convert_config(d) == {
@@ -18,6 +19,7 @@ def test_convert_config():
         'bottom': True,
         'force_bottom': False,
         'rollup': False,
+        'recompute_interval': 2.5,
         'somethingelse': 'True',
     }
 
@@ -54,3 +56,17 @@ def test_fanstatic_config():
         'recompute_hashes': False,
         'publisher_signature': 'foo',
     }
+
+
+def test_publisher_config():
+    from fanstatic import make_publisher
+
+    fanstatic = make_fanstatic(
+        None, {}, publisher_cache_size='10', compress='true')
+    assert fanstatic.publisher.routes.maxsize == 10
+    assert fanstatic.publisher.compress
+    assert 'publisher_cache_size' not in fanstatic.app.config
+
+    publisher = make_publisher({}, publisher_cache_size='10', compress='no')
+    assert publisher.cache_size == 10
+    assert not publisher.compress
@@ -1,5 +1,6 @@
 import os
 import re
+import threading
 import time
 
 import pytest
@@ -12,19 +13,25 @@ from fanstatic import Library
 from fanstatic import LibraryDependencyCycleError
 from fanstatic import NeededResources
 from fanstatic import Resource
+from fanstatic import Slot
 from fanstatic import UnknownResourceError
 from fanstatic import UnknownResourceExtensionError
 from fanstatic import clear_needed
 from fanstatic import del_needed
+from fanstatic import get_library_registry
 from fanstatic import get_needed
 from fanstatic import init_needed
 from fanstatic import register_inclusion_renderer
+from fanstatic import set_deferred_graph_construction
 from fanstatic import set_resource_file_existence_checking
 from fanstatic.core import ModeResourceDependencyError
 from fanstatic.core import inclusion_renderers
+from fanstatic.core import resolution_cache
 from fanstatic.core import thread_local_needed_data
+from fanstatic.inclusion import RollupIndex
 from fanstatic.inclusion import bundle_resources
 from fanstatic.inclusion import rollup_resources
+from fanstatic.inclusion import sort_key
 from fanstatic.inclusion import sort_resources
 
 
@@ -139,6 +146,33 @@ def test_convenience_clear_not_initialized():
         clear_needed()
 
 
+def test_needed_per_asyncio_task():
+    import asyncio
+
+    foo = Library('foo', '')
+    resources = [Resource(foo, f'r{i}.js') for i in range(100)]
+
+    async def request(resource):
+        needed = init_needed()
+        await asyncio.sleep(0)
+        resource.need()
+        await asyncio.sleep(0)
+        assert get_needed() is needed
+        result = needed.resources()
+        del_needed()
+        assert not get_needed().has_resources()
+        return result
+
+    async def serve():
+        return await asyncio.gather(*map(request, resources))
+
+    results = asyncio.run(serve())
+    assert results == [{resource} for resource in resources]
+    # The needed resources of the tasks did not end up in the thread-local
+    # data.
+    assert NEEDED not in thread_local_needed_data.__dict__
+
+
 def test_convenience_need():
     foo = Library('foo', '')
     x1 = Resource(foo, 'a.js')
@@ -514,6 +548,51 @@ def test_rollup_size_competing():
     assert rollup_resources([d1, d2, d3]) == {giant_bigger}
 
 
+def test_rollup_index():
+    foo = Library('foo', '')
+    d1 = Resource(foo, 'd1.js')
+    d2 = Resource(foo, 'd2.js')
+    d3 = Resource(foo, 'd3.js')
+    d4 = Resource(foo, 'd4.js')
+    giant = Resource(foo, 'giant.js', supersedes=[d1, d2])
+    other_giant = Resource(foo, 'other-giant.js', supersedes=[d2, d1])
+    giant_bigger = Resource(foo, 'giant-bigger.js',
+                            supersedes=[d1, d2, d3])
+
+    index = RollupIndex([foo])
+    assert index.rollup([d1]) == {d1}
+    assert index.rollup([d1, d4]) == {d1, d4}
+    # Of rollups of the same size, the last one defined wins.
+    assert index.rollup([d1, d2]) == {other_giant}
+    assert index.rollup([d1, d2, d3, d4]) == {giant_bigger, d4}
+    # Rollups unknown to the index are not handled.
+    bar = Library('bar', '')
+    e1 = Resource(bar, 'e1.js')
+    Resource(bar, 'e-giant.js', supersedes=[e1])
+    assert index.rollup([d1, e1]) is None
+    # The index follows changes of the dependency graph.
+    d3_giant = Resource(foo, 'd3-giant.js', supersedes=[d3])
+    assert index.rollup([d3]) == {d3_giant}
+
+    for needed in ([d1, d2], [d1, d2, d3], [d2, d3, d4]):
+        assert index.rollup(needed) == rollup_resources(needed)
+    assert giant not in index.rollup([d1, d2, d3])
+
+
+def test_rollup_resources_uses_registry_index():
+    foo = Library('foo', '')
+    b1 = Resource(foo, 'b1.js')
+    b2 = Resource(foo, 'b2.js')
+    giant = Resource(foo, 'giant.js', supersedes=[b1, b2])
+    registry = get_library_registry()
+    registry.add(foo)
+    registry.prepare()
+
+    assert registry.rollup_index.rollup([b1, b2]) == {giant}
+    assert rollup_resources([b1, b2]) == {giant}
+    assert rollup_resources([b1]) == {b1}
+
+
 def test_rollup_with_slot():
     from fanstatic import Slot
 
@@ -687,6 +766,20 @@ def test_library_url_version_hashing(tmpdir):
     assert needed.library_url(bar) == '/fanstatic/bar/:version:1'
 
 
+def test_library_url_version_method(tmpdir):
+    foo = Library('foo', tmpdir.join('foo').strpath)
+    tmpdir.mkdir('foo').join('a.js').write('a')
+    bar = Library('bar', tmpdir.join('bar').strpath)
+    tmpdir.mkdir('bar').join('a.js').write('a')
+
+    needed = init_needed(versioning=True, version_method='content')
+    assert needed.library_url(foo).split('/')[-1] == \
+        needed.library_url(bar).split('/')[-1]
+
+    with pytest.raises(ConfigurationError):
+        init_needed(versioning=True, version_method='unknown')
+
+
 def test_library_url_hashing_norecompute(tmpdir):
     foo = Library('foo', tmpdir.strpath)
 
@@ -746,6 +839,92 @@ def test_library_url_with_url_caching(tmpdir):
     assert needed.library_url(foo) == url
 
 
+def test_library_url_manifest(tmpdir):
+    from fanstatic.checksum import MANIFEST
+
+    foo = Library('foo', tmpdir.strpath)
+    tmpdir.join(MANIFEST).write('{"signature": "built"}')
+
+    def version_method(path):
+        raise AssertionError('The signature is read from the manifest.')
+
+    needed = init_needed(versioning=True, recompute_hashes=False)
+    needed._version_method = version_method
+    assert needed.library_url(foo) == '/fanstatic/foo/:version:built'
+
+    # When recomputing hashes, the manifest is not used.
+    needed = init_needed(versioning=True, recompute_hashes=True)
+    assert needed.library_url(foo) != '/fanstatic/foo/:version:built'
+
+
+def test_library_signature_recompute_interval(tmpdir, monkeypatch):
+    foo = Library('foo', tmpdir.strpath)
+    computed = []
+
+    def version_method(path):
+        computed.append(path)
+        return str(len(computed))
+
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+
+    def signature():
+        return foo.signature(
+            recompute_hashes=True, version_method=version_method,
+            interval=10)
+
+    assert signature() == ':version:1'
+    now[0] += 5
+    assert signature() == ':version:1'
+    now[0] += 5
+    assert signature() == ':version:2'
+
+    # While another thread recomputes the signature, the previous one
+    # is used.
+    now[0] += 10
+    with foo._signature_lock:
+        assert signature() == ':version:2'
+    assert signature() == ':version:3'
+    assert len(computed) == 3
+
+
+def test_library_url_recompute_interval(tmpdir):
+    foo = Library('foo', tmpdir.strpath)
+    computed = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def version_method(path):
+        computed.append(path)
+        if len(computed) > 1:
+            started.set()
+            release.wait(5)
+        return str(len(computed))
+
+    def library_url():
+        needed = init_needed(
+            versioning=True, recompute_hashes=True, recompute_interval=0)
+        needed._version_method = version_method
+        return needed.library_url(foo)
+
+    assert library_url() == '/fanstatic/foo/:version:1'
+    urls = []
+    threads = [
+        threading.Thread(target=lambda: urls.append(library_url()))
+        for i in range(5)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+        thread.join()
+    # Only one thread computes, the others use the previous signature.
+    assert urls == ['/fanstatic/foo/:version:1'] * 4
+    release.set()
+    threads[0].join()
+    assert urls[-1] == '/fanstatic/foo/:version:2'
+    assert len(computed) == 2
+
+
 # XXX add sanity checks: cannot declare something bottom safe while
 # what it depends on isn't bottom safe
 
@@ -1275,3 +1454,236 @@ def test_dummy_needed_should_take_slots_argument():
     needed = get_needed()
     a_resource = object()
     needed.need(a_resource, slots={})
+
+
+def test_resolution_cache():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+    x2 = Resource(foo, 'b.css')
+    y1 = Resource(foo, 'c.js', depends=[x1, x2])
+
+    needed = init_needed(resources=[y1])
+    hits, misses = resolution_cache.hits, resolution_cache.misses
+    assert needed.resources() == {x1, x2, y1}
+    assert resolution_cache.misses == misses + 1
+
+    # Another request needing the same resources is served from the cache.
+    needed = init_needed(resources=[y1])
+    assert needed.resources() == {x1, x2, y1}
+    assert resolution_cache.hits == hits + 1
+    assert resolution_cache.misses == misses + 1
+
+    # The result is a copy, changing it does not affect the cache.
+    needed.resources().add(x1)
+    assert needed.resources() == {x1, x2, y1}
+
+
+def test_resolution_cache_invalidated_on_graph_change():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+    y1 = Resource(foo, 'c.js', depends=[x1])
+
+    needed = init_needed(resources=[y1])
+    assert needed.resources() == {x1, y1}
+
+    x2 = Resource(foo, 'b.js')
+    x1.add_dependency(x2)
+    assert needed.resources() == {x1, x2, y1}
+
+    get_library_registry().clear()
+    assert len(resolution_cache) == 0
+
+
+def test_closure_index():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+    x2 = Resource(foo, 'b.css')
+    slot = Slot(foo, '.js', depends=[x1])
+    y1 = Resource(foo, 'c.js', depends=[x2, slot])
+    group = Group([x1, x2])
+
+    registry = get_library_registry()
+    assert registry.closure_index is None
+    registry.prepare()
+    index = registry.closure_index
+    assert len(index) == 4
+    assert index.decode(index.closure(group)) == [x1, x2]
+    assert index.decode(index.closure(y1)) == [x1, x2, slot, y1]
+    assert index.resolve([y1]) == ([x1, x2, y1], [slot])
+    assert index.resolve([group]) == ([x1, x2], [])
+
+    # The closures are stored as bitmasks instead of sets.
+    for dependable in [x1, x2, slot, y1, group]:
+        assert dependable._resources is None
+    assert y1.resources == {x1, x2, slot, y1}
+    assert group.resources == {x1, x2}
+
+    # Resources defined after preparing the registry are not indexed.
+    z1 = Resource(foo, 'z.js')
+    assert index.resolve([z1]) is None
+
+    # Closures follow changes in the dependency graph.
+    x2.add_dependency(z1)
+    assert group.resources == {x1, x2, z1}
+    assert y1.resources == {x1, x2, slot, y1, z1}
+    assert x1._resources is None
+    assert index.resolve([group]) is None
+
+    registry.clear()
+    assert registry.closure_index is None
+
+
+def test_closure_index_far_apart():
+    foo = Library('foo', '')
+    resources = [Resource(foo, 'r%d.js' % i) for i in range(10)]
+    slot = Slot(foo, '.js')
+    last = Resource(foo, 'last.js', depends=[slot])
+
+    registry = get_library_registry()
+    registry.prepare()
+    index = registry.closure_index
+    # Closures that are far apart are decoded one by one.
+    found, slots = index.resolve([resources[0], last])
+    assert set(found) == {resources[0], last}
+    assert slots == [slot]
+
+    # A closure is decoded from its lowest asset on.
+    decoded = []
+    decode = index.decode
+
+    def log_decode(closure, offset=0):
+        decoded.append((closure, offset))
+        return decode(closure, offset)
+    index.decode = log_decode
+    assert last.resources == {slot, last}
+    assert decoded == [(0b11, 10)]
+
+
+def test_resources_with_closure_index():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+    x2 = Resource(foo, 'b.js')
+    slot = Slot(foo, '.js', depends=[x1])
+    y1 = Resource(foo, 'c.js', depends=[slot])
+
+    needed = init_needed()
+    assert get_library_registry().closure_index is not None
+    needed.need(y1, {slot: x2})
+    resources = needed.resources()
+    assert len(resources) == 3
+    assert x1 in resources
+    assert y1 in resources
+    filled_slot, = resources - {x1, y1}
+    assert filled_slot.filledby is x2
+
+
+def test_deferred_graph_construction():
+    set_deferred_graph_construction(True)
+    foo = Library('foo', '')
+    a1 = Resource(foo, 'a1.js')
+    b1 = Resource(foo, 'b1.js', depends=[a1])
+    group = Group([b1])
+    c1 = Resource(foo, 'c1.js', depends=[group])
+    a2 = Resource(foo, 'a2.js')
+    b1.add_dependency(a2)
+
+    # Only the edges have been recorded so far.
+    assert b1._resources is None
+    assert a1.supports == {b1}
+
+    get_library_registry().prepare()
+    assert a1.resources == {a1}
+    assert b1.resources == {a1, a2, b1}
+    assert group.resources == {a1, a2, b1}
+    assert c1.resources == {a1, a2, b1, c1}
+    assert c1.dependency_nr == 2
+
+    needed = init_needed(resources=[c1])
+    assert sort_resources(needed.resources()) == [a1, a2, b1, c1]
+
+
+def test_deferred_graph_construction_computed_on_access():
+    set_deferred_graph_construction(True)
+    foo = Library('foo', '')
+    a1 = Resource(foo, 'a1.js')
+    b1 = Resource(foo, 'b1.js', depends=[a1])
+    assert b1.resources == {a1, b1}
+
+    a2 = Resource(foo, 'a2.js')
+    a1.add_dependency(a2)
+    assert b1.resources == {a1, a2, b1}
+
+
+def test_deferred_graph_construction_library_dependency_cycles():
+    set_deferred_graph_construction(True)
+    A = Library('A', '')
+    B = Library('B', '')
+    a1 = Resource(A, 'a1.js')
+    b1 = Resource(B, 'b1.js')
+    Resource(A, 'a2.js', depends=[b1])
+    Resource(B, 'b2.js', depends=[a1])
+
+    with pytest.raises(LibraryDependencyCycleError):
+        get_library_registry().prepare()
+
+
+def test_list_supporting_diamonds():
+    foo = Library('foo', '')
+    core = Resource(foo, 'core.js')
+    layer = [core]
+    supporting = set()
+    for level in range(30):
+        layer = [
+            Resource(foo, f'l{level}_{i}.js', depends=layer)
+            for i in range(3)]
+        supporting.update(layer)
+    # This would take forever without memoization.
+    assert core.list_supporting() == supporting
+
+    plugin = Resource(foo, 'plugin.js', depends=[core])
+    assert core.list_supporting() == supporting | {plugin}
+
+    # Adding a dependency below the core invalidates the cached supporting
+    # dependables of the core as well.
+    base = Resource(foo, 'base.js')
+    core.add_dependency(base)
+    assert base.list_supporting() == supporting | {plugin, core}
+    assert layer[0].resources == supporting - set(layer[1:]) | {core, base}
+
+
+def test_sort_resources_by_rank():
+    foo = Library('foo', '')
+    bar = Library('bar', '')
+    a1 = Resource(foo, 'a1.js', minified='a1.min.js')
+    a2 = Resource(foo, 'a2.css')
+    b1 = Resource(bar, 'b1.js', depends=[a1])
+    b2 = Resource(bar, 'b2.js')
+
+    assert a1.rank is None
+    get_library_registry().prepare()
+    ranked = [a2, a1, a1.mode('minified'), b2, b1]
+    first = a2.rank
+    assert [resource.rank for resource in ranked] == list(
+        range(first, first + 5))
+    assert sort_resources([b1, b2, a1, a2]) == [a2, a1, b2, b1]
+    assert sort_resources([b2, b1, a1, a2]) == sorted(
+        [b2, b1, a1, a2], key=sort_key)
+
+    # Resources without a rank are sorted by the full sort key.
+    b1.rank = None
+    assert sort_resources([b1, b2, a1, a2]) == [a2, a1, b2, b1]
+
+
+def test_sort_resources_ranked_by_other_registries():
+    from fanstatic import LibraryRegistry
+
+    a = Library('a', '')
+    b = Library('b', '')
+    z_js = Resource(a, 'z.js')
+    a_js = Resource(b, 'a.js')
+    LibraryRegistry([a]).prepare()
+    LibraryRegistry([b]).prepare()
+    # The ranks come from different prepare() passes and are not compared.
+    assert z_js.rank < a_js.rank
+    assert sort_resources([a_js, z_js]) == sorted(
+        [a_js, z_js], key=sort_key) == [z_js, a_js]
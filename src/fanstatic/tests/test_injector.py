@@ -105,6 +105,21 @@ def test_needed_deleted_after_request():
         dummy.clear()
 
 
+def test_needed_deleted_after_failing_request():
+    def failing_app(environ, start_response):
+        raise ValueError('Boom')
+
+    wrapped_app = Injector(failing_app)
+    request = webob.Request.blank('/')
+    with pytest.raises(ValueError):
+        request.get_response(wrapped_app)
+    # The NeededResources object is gone, although the application
+    # raised an exception.
+    dummy = get_needed()
+    with pytest.raises(NotImplementedError):
+        dummy.clear()
+
+
 def test_no_inject_into_non_html():
     foo = Library('foo', '')
     x1 = Resource(foo, 'a.js')
@@ -158,3 +173,83 @@ def test_can_handle_no_content():
     wrapped_app = Injector(app)
     request = webob.Request.blank('/', method='GET')
     request.get_response(wrapped_app)
+
+
+def test_inject_streaming():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+    x2 = Resource(foo, 'b.js', bottom=True)
+    closed = []
+
+    class AppIter:
+        def __iter__(self):
+            yield b'<html><head>'
+            # Resources can be needed while the body is produced.
+            get_needed().need(x1)
+            yield b'</he'
+            get_needed().need(x2)
+            yield b'ad><body>' + b'x' * 100000
+            yield b'</body></html>'
+
+        def close(self):
+            closed.append(True)
+
+    def app(environ, start_response):
+        start_response('200 OK', [
+            ('Content-Type', 'text/html'), ('Content-Length', '100043')])
+        return AppIter()
+
+    wrapped_app = Injector(app, stream=True, bottom=True)
+    request = webob.Request.blank('/')
+    response = request.get_response(wrapped_app)
+    assert response.content_length is None
+    assert response.body == (
+        b'<html><head><script type="text/javascript" '
+        b'src="/fanstatic/foo/a.js"></script></head><body>' +
+        b'x' * 100000 +
+        b'<script type="text/javascript" '
+        b'src="/fanstatic/foo/b.js"></script></body></html>')
+    assert closed == [True]
+    # The needed resources are gone once the body has been sent.
+    assert not get_needed().has_resources()
+
+
+def test_inject_overridden_call():
+    from fanstatic.injector import TopBottomInjector
+
+    x1 = Resource(Library('foo', ''), 'a.js')
+
+    class BodyClassInjector(TopBottomInjector):
+        def __call__(self, html, needed, request=None, response=None):
+            html = super().__call__(html, needed, request, response)
+            return html.replace(b'<body>', b'<body class="x">')
+
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html')])
+        get_needed().need(x1)
+        return [b'<html><head></head><body></body></html>']
+
+    # The overridden __call__ is used, also when streaming is asked for.
+    for stream in [False, True]:
+        wrapped_app = Injector(
+            app, injector=BodyClassInjector({}), stream=stream)
+        response = webob.Request.blank('/').get_response(wrapped_app)
+        assert response.body == (
+            b'<html><head><script type="text/javascript" '
+            b'src="/fanstatic/foo/a.js"></script></head>'
+            b'<body class="x"></body></html>')
+
+
+def test_inject_streaming_not_html():
+    x1 = Resource(Library('foo', ''), 'a.js')
+
+    def app(environ, start_response):
+        start_response('200 OK', [
+            ('Content-Type', 'text/plain'), ('Content-Length', '7')])
+        get_needed().need(x1)
+        return [b'</head>']
+
+    wrapped_app = Injector(app, stream=True)
+    response = webob.Request.blank('/').get_response(wrapped_app)
+    assert response.body == b'</head>'
+    assert response.content_length == 7
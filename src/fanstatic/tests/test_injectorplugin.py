@@ -1,4 +1,5 @@
 import pytest
+import webob
 
 from fanstatic import ConfigurationError
 from fanstatic import Library
@@ -6,6 +7,7 @@ from fanstatic import Resource
 from fanstatic import init_needed
 from fanstatic import make_injector
 from fanstatic.injector import InjectorPlugin
+from fanstatic.injector import PreloadInjector
 from fanstatic.injector import TopBottomInjector
 from fanstatic.registry import InjectorRegistry
 
@@ -81,3 +83,75 @@ def test_wsgi_middleware_lookup_injector_register(injectors):
 
     # After registering, no longer raise a Configuration Error.
     make_injector(None, {}, injector='top')
+
+
+def test_preload_injector():
+    foo = Library('foo', '')
+    a = Resource(foo, 'a.css', minified='a.min.css')
+    b = Resource(foo, 'b.css')
+    c = Resource(foo, 'c.js', depends=[a])
+    d = Resource(foo, 'd.mjs', renderer=lambda url: url)
+    e = Resource(foo, 'e.ico')
+    needed = init_needed(resources=[b, c, d, e])
+
+    injector = make_injector(None, {}, injector='preload')
+    assert isinstance(injector.injector, PreloadInjector)
+
+    inj = PreloadInjector({})
+    assert inj.response_headers(needed) == [
+        ('Link', '</fanstatic/foo/a.css>; rel=preload; as=style'),
+        ('Link', '</fanstatic/foo/b.css>; rel=preload; as=style'),
+        ('Link', '</fanstatic/foo/c.js>; rel=preload; as=script'),
+        ('Link', '</fanstatic/foo/d.mjs>; rel=modulepreload')]
+    html = b'<html><head></head><body></body></html>'
+    assert inj(html, needed) == TopBottomInjector({})(html, needed)
+
+    # Modes and bundles are respected.
+    inj = PreloadInjector({'minified': True, 'bundle': True})
+    assert inj.links(needed)[0] == (
+        '</fanstatic/foo/:bundle:a.min.css;b.css>; rel=preload; as=style')
+
+    inj = PreloadInjector({'preload_only': True})
+    assert inj(html, needed) == html
+    assert len(inj.links(needed)) == 4
+
+
+def test_preload_injector_bundle_bottom():
+    foo = Library('foo', '')
+    a = Resource(foo, 'a.js')
+    b = Resource(foo, 'b.js', bottom=True)
+    needed = init_needed(resources=[a, b])
+
+    # The links point to what the page includes, not to a bundle of the
+    # top and bottom resources.
+    inj = PreloadInjector({'bundle': True, 'bottom': True})
+    assert inj.links(needed) == [
+        '</fanstatic/foo/a.js>; rel=preload; as=script',
+        '</fanstatic/foo/b.js>; rel=preload; as=script']
+    html = inj(b'<html><head></head><body></body></html>', needed)
+    assert b'/fanstatic/foo/a.js' in html
+    assert b'/fanstatic/foo/b.js' in html
+    assert b':bundle:' not in html
+
+
+def test_preload_injector_wsgi():
+    foo = Library('foo', '')
+    a = Resource(foo, 'a.js')
+
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html')])
+        a.need()
+        return [b'<html><head></head><body></body></html>']
+
+    wrapped_app = make_injector(app, {}, injector='preload')
+    response = webob.Request.blank('/').get_response(wrapped_app)
+    assert response.headers.getall('Link') == [
+        '</fanstatic/foo/a.js>; rel=preload; as=script']
+    assert b'/fanstatic/foo/a.js' in response.body
+
+    wrapped_app = make_injector(
+        app, {}, injector='preload', preload_only='true', stream='true')
+    response = webob.Request.blank('/').get_response(wrapped_app)
+    assert response.headers.getall('Link') == [
+        '</fanstatic/foo/a.js>; rel=preload; as=script']
+    assert response.body == b'<html><head></head><body></body></html>'
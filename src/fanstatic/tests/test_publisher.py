@@ -1,3 +1,4 @@
+import os
 from datetime import datetime
 from datetime import timedelta
 
@@ -282,3 +283,442 @@ r4'''
     request = webob.Request.blank('/foo/sub/sub/:bundle:r1.css;r4.css;r2.css')
     response = request.get_response(app)
     assert response.status_int == 404
+
+
+def test_publisher_routes(tmpdir):
+    foo_library_dir = tmpdir.mkdir('foo')
+    tmpdir.join('foo').join('test.js').write('/* a test */')
+    publisher = Publisher(
+        LibraryRegistry([Library('foo', foo_library_dir.strpath)]))
+
+    response = webob.Request.blank(
+        '/foo/:version:1/test.js').get_response(publisher)
+    assert response.body == b'/* a test */'
+    app, need_caching = publisher.routes.get('/foo/:version:1/test.js')
+    assert need_caching
+
+    # Known URLs are served from the routing table.
+    publisher.route = None
+    response = webob.Request.blank(
+        '/foo/:version:1/test.js').get_response(publisher)
+    assert response.body == b'/* a test */'
+    assert response.cache_control.max_age == FOREVER
+
+
+def test_delegator_paths():
+    environs = []
+
+    def app(environ, start_response):
+        environs.append((environ['SCRIPT_NAME'], environ['PATH_INFO']))
+        start_response('200 OK', [])
+        return [b'']
+
+    delegator = Delegator(app, app)
+    for path in ['/foo/fanstatic', '/foo/fanstatic/bar/fanstatic/baz.js']:
+        webob.Request.blank(
+            path, environ={'SCRIPT_NAME': '/root'}).get_response(delegator)
+    assert environs == [
+        ('/root', '/foo/fanstatic'),
+        ('/root/foo/fanstatic', '/bar/fanstatic/baz.js')]
+
+
+def test_file_app_like_webob(tmpdir):
+    from fanstatic.publisher import FileApp
+
+    for name in ['test.js', 'test.css', 'test.svg', 'test.png', 'test',
+                 'test.js.gz']:
+        path = tmpdir.join(name)
+        path.write(b'/* a test */', mode='wb')
+        last_modified = webob.Request.blank('/').get_response(
+            webob.static.FileApp(path.strpath)).headers['Last-Modified']
+        for method, headers in [
+                ('GET', {}),
+                ('HEAD', {}),
+                ('POST', {}),
+                ('GET', {'If-Modified-Since': last_modified}),
+                ('GET',
+                 {'If-Modified-Since': 'Sat, 01 Jan 2000 00:00:00 GMT'}),
+                ('GET', {'Range': 'bytes=2-4'}),
+                ('HEAD', {'Range': 'bytes=2-'}),
+                ('GET', {'Range': 'bytes=-3'}),
+                ('GET', {'Range': 'bytes=20-40'}),
+                ('GET', {'Range': 'bytes=2-4,6-8'}),
+                ('GET', {'Range': 'bytes=2-4', 'If-Range': last_modified}),
+                ('GET', {'Range': 'bytes=2-4',
+                         'If-Range': 'Sat, 01 Jan 2000 00:00:00 GMT'}),
+                ('GET', {'Range': 'bytes=2-4', 'If-Range': '"etag"'})]:
+            responses = [
+                webob.Request.blank(
+                    '/', method=method, headers=headers).get_response(app)
+                for app in [webob.static.FileApp(path.strpath),
+                            FileApp(path.strpath)]]
+            expected, response = responses
+            assert response.status == expected.status
+            assert sorted(response.headerlist) == sorted(expected.headerlist)
+            if response.status_int < 400:
+                assert response.body == expected.body
+
+
+def test_file_app_file_wrapper(tmpdir):
+    from fanstatic.publisher import FileApp
+
+    path = tmpdir.join('test.js')
+    path.write('/* a test */')
+    wrapped = []
+
+    def file_wrapper(file, block_size):
+        wrapped.append(file.name)
+        return iter(lambda: file.read(block_size), b'')
+
+    request = webob.Request.blank(
+        '/', environ={'wsgi.file_wrapper': file_wrapper})
+    response = request.get_response(FileApp(path.strpath))
+    assert response.body == b'/* a test */'
+    assert wrapped == [path.strpath]
+
+
+def test_library_publisher_make_fileapp(tmpdir):
+    from fanstatic.publisher import FileApp
+    from fanstatic.publisher import LibraryPublisher
+
+    tmpdir.join('test.js').write('/* a test */')
+    foo = Library('foo', tmpdir.strpath)
+    assert isinstance(
+        LibraryPublisher(foo).find_app('/test.js'), FileApp)
+
+    class MyLibraryPublisher(LibraryPublisher):
+        def make_fileapp(self, path):
+            return webob.static.FileApp(path)
+
+    app = MyLibraryPublisher(foo).find_app('/test.js')
+    assert isinstance(app, webob.static.FileApp)
+    assert webob.Request.blank('/').get_response(app).body == \
+        b'/* a test */'
+
+
+def test_bundle_cache(tmpdir):
+    from fanstatic.publisher import bundle_cache
+
+    foo_library_dir = tmpdir.mkdir('foo')
+    foo = Library('foo', foo_library_dir.strpath)
+    Resource(foo, 'a.js')
+    Resource(foo, 'b.js')
+    tmpdir.join('foo').join('a.js').write('/* a */')
+    tmpdir.join('foo').join('b.js').write('/* b */')
+    app = Publisher(LibraryRegistry([foo]))
+
+    response = webob.Request.blank('/foo/:bundle:a.js;b.js').get_response(app)
+    assert response.body == b'/* a */\n/* b */'
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+    # Conditional requests are answered from the cache.
+    hits = bundle_cache.hits
+    for headers in [
+            {'If-None-Match': etag},
+            {'If-None-Match': '"other", W/%s' % etag},
+            {'If-Modified-Since': last_modified}]:
+        response = webob.Request.blank(
+            '/foo/:bundle:a.js;b.js', headers=headers).get_response(app)
+        assert response.status_int == 304
+        assert response.body == b''
+        assert response.headers['ETag'] == etag
+    assert bundle_cache.hits == hits + 3
+
+    response = webob.Request.blank(
+        '/foo/:bundle:a.js;b.js',
+        headers={'If-None-Match': '"other"',
+                 'If-Modified-Since': last_modified}).get_response(app)
+    assert response.status_int == 200
+
+    response = webob.Request.blank(
+        '/foo/:bundle:a.js;b.js', method='HEAD').get_response(app)
+    assert response.body == b''
+    assert response.content_length == 15
+
+    response = webob.Request.blank(
+        '/foo/:bundle:a.js;b.js',
+        headers={'Range': 'bytes=8-', 'If-Range': etag}).get_response(app)
+    assert response.status_int == 206
+    assert response.body == b'/* b */'
+    assert response.headers['Content-Range'] == 'bytes 8-14/15'
+
+    response = webob.Request.blank(
+        '/foo/:bundle:a.js;b.js',
+        headers={'Range': 'bytes=20-'}).get_response(app)
+    assert response.status_int == 416
+
+    response = webob.Request.blank(
+        '/foo/:version:1/:bundle:a.js;b.js').get_response(app)
+    assert response.body == b'/* a */\n/* b */'
+
+    # Unversioned bundles notice changed files, versioned ones are not
+    # checked again.
+    tmpdir.join('foo').join('b.js').write('/* b, changed */')
+    response = webob.Request.blank('/foo/:bundle:a.js;b.js').get_response(app)
+    assert response.body == b'/* a */\n/* b, changed */'
+    assert response.headers['ETag'] != etag
+    response = webob.Request.blank(
+        '/foo/:version:1/:bundle:a.js;b.js').get_response(app)
+    assert response.body == b'/* a */\n/* b */'
+
+    tmpdir.join('foo').join('b.js').remove()
+    response = webob.Request.blank('/foo/:bundle:a.js;b.js').get_response(app)
+    assert response.status_int == 404
+
+
+def test_negotiate_encoding():
+    from fanstatic.compression import ENCODINGS
+    from fanstatic.compression import negotiate
+
+    preferred = ENCODINGS[0]
+    gzip = ENCODINGS[-1]
+    assert negotiate(None) is None
+    assert negotiate('') is None
+    assert negotiate('identity') is None
+    assert negotiate('gzip') == gzip
+    assert negotiate('GZIP;q=0.5, deflate') == gzip
+    assert negotiate('gzip;q=0') is None
+    assert negotiate('*') == preferred
+    assert negotiate('*, gzip;q=0') == (
+        None if preferred is gzip else preferred)
+    assert negotiate('gzip, deflate, br') == preferred
+
+
+def test_compressed_file(tmpdir):
+    import gzip
+
+    foo_library_dir = tmpdir.mkdir('foo')
+    content = b'var a = 1;\n' * 100
+    tmpdir.join('foo').join('test.js').write(content, mode='wb')
+    tmpdir.join('foo').join('logo.png').write(content, mode='wb')
+    app = Publisher(
+        LibraryRegistry([Library('foo', foo_library_dir.strpath)]),
+        compress=True)
+
+    # Without a precompressed variant, the file is compressed on the fly.
+    response = webob.Request.blank(
+        '/foo/test.js', headers={'Accept-Encoding': 'gzip'}).get_response(app)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.content_length == len(response.body)
+    assert gzip.decompress(response.body) == content
+
+    # A precompressed variant is preferred, as long as it is not older
+    # than the file.
+    sidecar = tmpdir.join('foo').join('test.js.gz')
+    sidecar.write(b'precompressed', mode='wb')
+    response = webob.Request.blank(
+        '/foo/test.js', headers={'Accept-Encoding': 'gzip'}).get_response(app)
+    assert response.body == b'precompressed'
+    assert response.content_length == 13
+    mtime = os.path.getmtime(sidecar.strpath)
+    os.utime(sidecar.strpath, (mtime - 10, mtime - 10))
+    response = webob.Request.blank(
+        '/foo/test.js', headers={'Accept-Encoding': 'gzip'}).get_response(app)
+    assert gzip.decompress(response.body) == content
+
+    response = webob.Request.blank(
+        '/foo/test.js', method='HEAD',
+        headers={'Accept-Encoding': 'gzip'}).get_response(app)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.body == b''
+
+    # Identity responses vary as well, ranges are not compressed.
+    for headers in [{}, {'Accept-Encoding': 'gzip', 'Range': 'bytes=0-2'}]:
+        response = webob.Request.blank(
+            '/foo/test.js', headers=headers).get_response(app)
+        assert 'Content-Encoding' not in response.headers
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert content.startswith(response.body)
+
+    # Binary files are not compressed.
+    response = webob.Request.blank(
+        '/foo/logo.png',
+        headers={'Accept-Encoding': 'gzip'}).get_response(app)
+    assert 'Content-Encoding' not in response.headers
+    assert 'Vary' not in response.headers
+    assert response.body == content
+
+    # Nor is anything if the publisher does not compress.
+    app = Publisher(
+        LibraryRegistry([Library('foo', foo_library_dir.strpath)]))
+    response = webob.Request.blank(
+        '/foo/test.js', headers={'Accept-Encoding': 'gzip'}).get_response(app)
+    assert response.body == content
+    assert 'Vary' not in response.headers
+
+
+def test_compressed_bundle(tmpdir):
+    import gzip
+
+    foo_library_dir = tmpdir.mkdir('foo')
+    foo = Library('foo', foo_library_dir.strpath)
+    Resource(foo, 'a.js')
+    Resource(foo, 'b.js')
+    tmpdir.join('foo').join('a.js').write('var a = 1;\n' * 100)
+    tmpdir.join('foo').join('b.js').write('var b = 1;\n' * 100)
+    app = Publisher(LibraryRegistry([foo]), compress=True)
+
+    identity = webob.Request.blank(
+        '/foo/:bundle:a.js;b.js').get_response(app)
+    assert identity.headers['Vary'] == 'Accept-Encoding'
+    response = webob.Request.blank(
+        '/foo/:bundle:a.js;b.js',
+        headers={'Accept-Encoding': 'gzip'}).get_response(app)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.body) == identity.body
+    etag = response.headers['ETag']
+    assert etag != identity.headers['ETag']
+
+    response = webob.Request.blank(
+        '/foo/:bundle:a.js;b.js',
+        headers={'Accept-Encoding': 'gzip',
+                 'If-None-Match': etag}).get_response(app)
+    assert response.status_int == 304
+    response = webob.Request.blank(
+        '/foo/:bundle:a.js;b.js',
+        headers={'If-None-Match': etag}).get_response(app)
+    assert response.status_int == 200
+
+
+def test_streamed_bundle(tmpdir, monkeypatch):
+    import fanstatic.publisher
+
+    foo_library_dir = tmpdir.mkdir('foo')
+    foo = Library('foo', foo_library_dir.strpath)
+    Resource(foo, 'a.js')
+    Resource(foo, 'b.js')
+    Resource(foo, 'c.js')
+    tmpdir.join('foo').join('a.js').write('aaaa')
+    tmpdir.join('foo').join('b.js').write('')
+    tmpdir.join('foo').join('c.js').write('cc')
+    body = b'aaaa\n\ncc'
+    app = Publisher(LibraryRegistry([foo]), compress=True)
+    monkeypatch.setattr(fanstatic.publisher, 'BUFFER_LIMIT', 5)
+
+    request = webob.Request.blank(
+        '/foo/:bundle:a.js;b.js;c.js', headers={'Accept-Encoding': 'gzip'})
+    response = request.get_response(app)
+    assert response.body == body
+    assert response.content_length == len(body)
+    # Streamed bundles are not compressed.
+    assert 'Content-Encoding' not in response.headers
+    assert not isinstance(request.call_application(app)[2], list)
+
+    response = webob.Request.blank(
+        '/foo/:bundle:a.js;b.js;c.js',
+        headers={'If-None-Match': response.headers['ETag']}).get_response(
+            app)
+    assert response.status_int == 304
+
+    response = webob.Request.blank(
+        '/foo/:bundle:a.js;b.js;c.js', method='HEAD').get_response(app)
+    assert response.body == b''
+    assert response.content_length == len(body)
+
+    for start in range(len(body)):
+        for stop in range(start + 1, len(body) + 1):
+            response = webob.Request.blank(
+                '/foo/:bundle:a.js;b.js;c.js',
+                headers={'Range': 'bytes=%d-%d' % (start, stop - 1)}
+            ).get_response(app)
+            assert response.status_int == 206
+            assert response.body == body[start:stop], (start, stop)
+            assert response.content_length == stop - start
+
+
+def test_compressed_file_too_large(tmpdir, monkeypatch):
+    import fanstatic.publisher
+
+    foo_library_dir = tmpdir.mkdir('foo')
+    tmpdir.join('foo').join('test.js').write('var a = 1;\n' * 100)
+    app = Publisher(
+        LibraryRegistry([Library('foo', foo_library_dir.strpath)]),
+        compress=True)
+    monkeypatch.setattr(fanstatic.publisher, 'BUFFER_LIMIT', 100)
+
+    # Large files are only compressed ahead of time.
+    response = webob.Request.blank(
+        '/foo/test.js', headers={'Accept-Encoding': 'gzip'}).get_response(app)
+    assert 'Content-Encoding' not in response.headers
+    assert response.body == b'var a = 1;\n' * 100
+
+    tmpdir.join('foo').join('test.js.gz').write(b'precompressed', mode='wb')
+    response = webob.Request.blank(
+        '/foo/test.js', headers={'Accept-Encoding': 'gzip'}).get_response(app)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.body == b'precompressed'
+
+
+def test_publisher_cache_size(tmpdir):
+    foo_library_dir = tmpdir.mkdir('foo')
+    foo = Library('foo', foo_library_dir.strpath)
+    for name in 'abcd':
+        Resource(foo, name + '.js')
+        tmpdir.join('foo').join(name + '.js').write(name)
+    publisher = Publisher(LibraryRegistry([foo]), cache_size=2)
+
+    for path in ['/foo/a.js', '/foo/:bundle:a.js;b.js', '/foo/c.js',
+                 '/foo/c.js', '/foo/d.js']:
+        assert webob.Request.blank(path).get_response(publisher).body
+    assert publisher.routes.stats() == {
+        'hits': 1, 'misses': 4, 'evictions': 2, 'size': 2, 'maxsize': 2}
+    library_publisher = publisher.directory_publishers['foo']
+    assert library_publisher.cached_apps.stats() == {
+        'hits': 0, 'misses': 4, 'evictions': 2, 'size': 2, 'maxsize': 2}
+    assert webob.Request.blank(
+        '/foo/a.js').get_response(publisher).body == b'a'
+
+
+def test_publisher_not_found_cache(tmpdir, monkeypatch):
+    import time
+
+    import fanstatic.publisher
+
+    now = 1000.0
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    foo_library_dir = tmpdir.mkdir('foo')
+    foo = Library('foo', foo_library_dir.strpath)
+    Resource(foo, 'a.js')
+    registry = LibraryRegistry([foo])
+    publisher = Publisher(registry)
+
+    def status(path):
+        return webob.Request.blank(path).get_response(publisher).status_int
+
+    # Without a version or a computed signature the files of a library may
+    # change at any time, so its misses are not remembered.
+    stats = publisher.not_found.stats
+    assert status('/foo/b.js') == 404
+    tmpdir.join('foo').join('b.js').write('b')
+    assert status('/foo/b.js') == 200
+    assert stats()['size'] == 0
+
+    foo._signature = 'computed'
+    for path in ['/bar/a.js', '/foo/a.js', '/foo/:bundle:a.js;b.js',
+                 '/foo/../secret']:
+        assert status(path) == status(path)
+    assert stats()['hits'] == 4
+
+    # Known misses do not touch the file system.
+    tmpdir.join('foo').join('a.js').write('a')
+    monkeypatch.setattr(os.path, 'isfile', None)
+    assert status('/foo/a.js') == 404
+    monkeypatch.undo()
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+
+    # They are forgotten when the library signature changes,
+    foo._signature = 'changed'
+    assert status('/foo/a.js') == 200
+    # when the registry or the dependency graph changes,
+    registry.clear()
+    registry.add(Library('bar', foo_library_dir.strpath))
+    assert status('/bar/a.js') == 200
+    # and after a while.
+    assert status('/foo/c.js') == 404
+    tmpdir.join('foo').join('c.js').write('c')
+    assert status('/foo/c.js') == 404
+    now += fanstatic.publisher.NOT_FOUND_TTL
+    assert status('/foo/c.js') == 200
@@ -1,3 +1,5 @@
+import functools
+
 import pytest
 
 from fanstatic import Library
@@ -56,3 +58,48 @@ def test_do_add_library_after_register():
 
     with pytest.raises(ValueError):
         library_registry.add(foo)
+
+
+def test_version_method_registry():
+    import fanstatic.checksum
+    from fanstatic import VersionMethodRegistry
+
+    registry = VersionMethodRegistry()
+    assert registry['mtime'] is fanstatic.checksum.mtime
+    assert registry['md5'] is fanstatic.checksum.md5
+    assert registry['content'] is fanstatic.checksum.content
+
+    def custom(path):
+        return 'custom'
+    registry.add(custom)
+    assert registry['custom'] is custom
+    registry.add(custom, 'other')
+    assert registry['other'] is custom
+
+    # Callables without a __name__ can be registered under a name.
+    partial = functools.partial(custom)
+    registry.add(partial, 'partial')
+    assert registry['partial'] is partial
+
+    # The items given replace the built-in methods.
+    registry = VersionMethodRegistry({'md5': partial})
+    assert registry['md5'] is partial
+    assert registry['mtime'] is fanstatic.checksum.mtime
+
+
+def test_version_method_registry_entry_points(monkeypatch):
+    import importlib.metadata
+
+    from fanstatic import VersionMethodRegistry
+
+    method = functools.partial(str)
+    entry_point = importlib.metadata.EntryPoint(
+        'custom', 'fanstatic:method', 'fanstatic.version_methods')
+    monkeypatch.setattr(
+        VersionMethodRegistry, 'entry_points', lambda self: [entry_point])
+    monkeypatch.setattr(
+        VersionMethodRegistry, 'make_item_from_entry_point',
+        lambda self, entry_point: method)
+    registry = VersionMethodRegistry()
+    registry.load_items_from_entry_points()
+    assert registry['custom'] is method
@@ -216,3 +216,36 @@ def test_group_need_should_pass_slots_to_needed():
     finally:
         fanstatic.del_needed()
     assert slot in needed._slots
+
+
+def test_filled_slots_are_interned():
+    from fanstatic.core import fill_slot
+    from fanstatic.core import filled_slot_cache
+
+    lib = Library('lib', '')
+    slot = Slot(lib, '.js')
+    a = Resource(lib, 'a.js', depends=[slot])
+    b = Resource(lib, 'b.js', minified='b.min.js')
+    c = Resource(lib, 'c.js')
+
+    needed = init_needed()
+    needed.need(a, {slot: b})
+    first, = [r for r in needed.resources() if r is not a]
+    needed = init_needed()
+    needed.need(a, {slot: b})
+    needed.need(c)
+    second, = [r for r in needed.resources() if r not in (a, c)]
+    assert first is second
+    assert first is fill_slot(slot, b)
+    assert first.mode(MINIFIED) is fill_slot(slot, b.modes[MINIFIED])
+
+    # Invalid fillings are not interned.
+    d = Resource(lib, 'd.css')
+    with pytest.raises(SlotError):
+        fill_slot(slot, d)
+    assert (slot, d) not in filled_slot_cache
+
+    # A change of the dependency graph forgets the filled slots.
+    Resource(lib, 'e.js')
+    assert (slot, b) not in filled_slot_cache
+    assert fill_slot(slot, b) is not first
@@ -4,6 +4,7 @@ from fanstatic import ConfigurationError
 from fanstatic import Library
 from fanstatic import Resource
 from fanstatic import init_needed
+from fanstatic.injector import Splicer
 from fanstatic.injector import TopBottomInjector
 
 
@@ -144,3 +145,118 @@ def test_html_insert():
 <html><head>something more<link rel="stylesheet" type="text/css" href="/fanstatic/foo/b.css" />
 <script type="text/javascript" src="/fanstatic/foo/a.js"></script>
 <script type="text/javascript" src="/fanstatic/foo/c.js"></script></head></html>'''  # noqa: E501 line too long
+
+
+def test_rendered_inclusions_are_cached():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+    x2 = Resource(foo, 'c.js')
+    y1 = Resource(foo, 'b.js', depends=[x1], bottom=True)
+    html = b'<html><head></head><body></body></html>'
+
+    injector = TopBottomInjector(dict(bottom=True))
+    needed = init_needed(resources=[y1])
+    result = injector(html, needed)
+    assert injector.inclusion_cache.misses == 1
+
+    needed = init_needed(resources=[y1])
+    assert injector(html, needed) == result
+    assert injector.inclusion_cache.hits == 1
+
+    # A different base_url results in a different rendering.
+    needed = init_needed(resources=[y1], base_url='http://example.com')
+    assert injector(html, needed) == b'''\
+<html><head><script type="text/javascript" src="http://example.com/fanstatic/foo/a.js"></script></head><body><script type="text/javascript" src="http://example.com/fanstatic/foo/b.js"></script></body></html>'''  # noqa: E501 line too long
+    assert injector.inclusion_cache.misses == 2
+
+    # Changing the dependency graph invalidates the cached renderings.
+    x1.add_dependency(x2)
+    needed = init_needed(resources=[y1])
+    assert b'/fanstatic/foo/c.js' in injector(html, needed)
+
+
+def test_rendered_inclusions_cache_keyed_on_signature():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+    html = b'<html><head></head><body></body></html>'
+
+    injector = TopBottomInjector({})
+    foo.version = '1.0'
+    needed = init_needed(resources=[x1], versioning=True)
+    assert b':version:1.0/a.js' in injector(html, needed)
+    foo.version = '2.0'
+    needed = init_needed(resources=[x1], versioning=True)
+    assert b':version:2.0/a.js' in injector(html, needed)
+
+
+def test_rendered_inclusions_not_cached_when_compiling():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+    needed = init_needed(resources=[x1])
+
+    injector = TopBottomInjector(dict(compile=True, inclusion_cache_size=10))
+    assert injector.inclusion_cache.maxsize == 10
+    injector(b'<html><head></head></html>', needed)
+    assert len(injector.inclusion_cache) == 0
+
+
+def test_splicer_matches_buffered_injection():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+    x2 = Resource(foo, 'b.css')
+    y1 = Resource(foo, 'c.js', depends=[x1, x2])
+
+    html = b"<html><head>start of head</head><body>rest of body</body></html>"
+    needed = init_needed(resources=[y1])
+    injector = TopBottomInjector(dict(bottom=True, force_bottom=True))
+    expected = injector(html, needed)
+
+    # Markers can be split over chunks at any position.
+    for size in range(1, len(html) + 1):
+        splicer = injector.splicer(needed)
+        result = []
+        for start in range(0, len(html), size):
+            result.extend(splicer.feed(html[start:start + size]))
+        result.append(splicer.close())
+        assert b''.join(result) == expected, size
+
+
+def test_splicer_without_markers():
+    splicer = Splicer([(b'</head>', lambda: b'<script />')])
+    chunks = [b'<html', b'><bo', b'dy></b', b'ody></h', b'tml>']
+    result = []
+    for chunk in chunks:
+        result.extend(splicer.feed(chunk))
+    result.append(splicer.close())
+    assert b''.join(result) == b''.join(chunks)
+    # Bytes are held back only as long as they could start a marker.
+    assert splicer.feed(b'</h') == [b'']
+    assert splicer.feed(b'ead>') == [b'', b'<script />', b'</head>']
+    assert splicer.feed(b'</head>') == [b'</head>']
+
+
+def test_splice():
+    foo = Library('foo', '')
+    x1 = Resource(foo, 'a.js')
+    x2 = Resource(foo, 'b.js', bottom=True)
+
+    needed = init_needed(resources=[x1, x2])
+    injector = TopBottomInjector(dict(bottom=True))
+    top, bottom = injector.render_inclusions(needed)
+
+    html = b"<html><head>head</head><body>body</body></html>"
+    pieces = injector.splice(html, needed)
+    assert [bytes(piece) for piece in pieces] == [
+        b'<html><head>head', top, b'</head><body>body', bottom,
+        b'</body></html>']
+    # The html is not copied.
+    assert all(piece.obj is html for piece in pieces[::2])
+
+    # The first markers are used, wherever they are.
+    for html in [b"<body></body></head>",
+                 b"<body></body>",
+                 b"<head></head></head><body></body></body>",
+                 b"<html></html>"]:
+        expected = html.replace(b'</head>', top + b'</head>', 1).replace(
+            b'</body>', bottom + b'</body>', 1)
+        assert injector(html, needed) == expected
@@ -0,0 +1,137 @@
+import os
+import time
+
+import pytest
+
+from fanstatic import Library
+from fanstatic import NeededResources
+from fanstatic.watcher import InotifyWatcher
+from fanstatic.watcher import PollingWatcher
+from fanstatic.watcher import load_libc
+
+
+def make_watcher(kind):
+    if kind == 'inotify':
+        libc = load_libc()
+        if libc is None:
+            pytest.skip('inotify is not available')
+        return InotifyWatcher(libc)
+    return PollingWatcher(interval=0.01)
+
+
+def wait_for_change(watcher, path):
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        if watcher.check(path):
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture(params=['inotify', 'polling'])
+def watcher(request):
+    watcher = make_watcher(request.param)
+    yield watcher
+    watcher.close()
+
+
+def test_watcher(watcher, tmpdir):
+    path = tmpdir.strpath
+    tmpdir.join('a.js').write('a')
+    tmpdir.mkdir('sub')
+    # The first check starts watching.
+    assert watcher.check(path)
+    assert not watcher.check(path)
+
+    time.sleep(0.05)
+    tmpdir.join('a.js').write('changed')
+    os.utime(tmpdir.join('a.js').strpath, (time.time() + 10,) * 2)
+    assert wait_for_change(watcher, path)
+    assert not watcher.check(path)
+
+    # New files in subdirectories, also new ones, are noticed.
+    tmpdir.join('sub').join('b.js').write('b')
+    assert wait_for_change(watcher, path)
+    new = tmpdir.join('sub').mkdir('new')
+    assert wait_for_change(watcher, path)
+    new.join('c.js').write('c')
+    os.utime(new.join('c.js').strpath, (time.time() + 20,) * 2)
+    assert wait_for_change(watcher, path)
+
+    tmpdir.join('a.js').remove()
+    assert wait_for_change(watcher, path)
+
+
+def test_watcher_nested(watcher, tmpdir):
+    # Libraries can be in each other's directories.
+    outer = tmpdir.strpath
+    inner = tmpdir.mkdir('sub').strpath
+    assert watcher.check(outer)
+    assert watcher.check(inner)
+
+    time.sleep(0.05)
+    tmpdir.join('sub').join('x.js').write('x')
+    assert wait_for_change(watcher, inner)
+    assert wait_for_change(watcher, outer)
+
+    tmpdir.join('sub').mkdir('new')
+    assert wait_for_change(watcher, inner)
+    assert wait_for_change(watcher, outer)
+    tmpdir.join('sub').join('new').join('y.js').write('y')
+    assert wait_for_change(watcher, inner)
+    assert wait_for_change(watcher, outer)
+
+
+def test_inotify_watcher_ignores(tmpdir):
+    watcher = make_watcher('inotify')
+    try:
+        path = tmpdir.strpath
+        assert watcher.check(path)
+        tmpdir.join('a.js.swp').write('swap')
+        tmpdir.mkdir('.git').join('index').write('index')
+        time.sleep(0.2)
+        assert not watcher.check(path)
+    finally:
+        watcher.close()
+
+
+def test_unwatchable(tmpdir):
+    watcher = PollingWatcher()
+    watcher.watch = lambda path: False
+    assert watcher.check(tmpdir.strpath)
+    assert watcher.check(tmpdir.strpath)
+    watcher.close()
+
+
+def test_signature_with_watcher(tmpdir, monkeypatch):
+    import fanstatic.watcher
+
+    watcher = make_watcher('polling')
+    monkeypatch.setattr(fanstatic.watcher, '_watcher', watcher)
+    foo = Library('foo', tmpdir.strpath)
+    tmpdir.join('a.js').write('a')
+
+    computed = []
+
+    def version_method(path):
+        computed.append(path)
+        return str(len(computed))
+
+    needed = NeededResources(
+        versioning=True, recompute_hashes=True, watch=True)
+    needed._version_method = version_method
+    url = needed.library_url(foo)
+    assert url == '/fanstatic/foo/:version:1'
+    for i in range(3):
+        needed._url_cache.clear()
+        assert needed.library_url(foo) == url
+    assert len(computed) == 1
+
+    tmpdir.join('b.js').write('b')
+    os.utime(tmpdir.join('b.js').strpath, (time.time() + 10,) * 2)
+    deadline = time.time() + 5
+    while needed.library_url(foo) == url and time.time() < deadline:
+        needed._url_cache.clear()
+        time.sleep(0.01)
+    assert needed.library_url(foo) == '/fanstatic/foo/:version:2'
+    watcher.close()
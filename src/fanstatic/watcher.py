@@ -0,0 +1,284 @@
+"""Watch library directories for changes.
+
+With ``recompute_hashes``, the signature of a library is computed again
+for every request, which walks and stats the whole library directory. A
+watcher keeps track of which directories changed instead, so signatures
+are only computed again after a change. On Linux, changes are reported by
+inotify; elsewhere (or if inotify cannot be used) the directories are
+polled in a background thread.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+import fanstatic.checksum
+
+
+class Watcher:
+    """Base class of the watchers.
+
+    A watcher starts watching a directory the first time it is
+    checked.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watched = set()
+        self._dirty = set()
+        self._unwatchable = set()
+        self.closed = False
+
+    def check(self, path):
+        """Return whether the contents of the directory ``path`` may have
+        changed since the last time it was checked.
+
+        This is always the case the first time, and when the directory
+        cannot be watched.
+        """
+        with self._lock:
+            if path in self._dirty:
+                self._dirty.discard(path)
+                return True
+            if path in self._watched:
+                return path in self._unwatchable
+            self._watched.add(path)
+        if not self.watch(path):
+            self.unwatchable(path)
+        return True
+
+    def unwatchable(self, path):
+        """Give up watching ``path``, it is always considered changed.
+        """
+        with self._lock:
+            self._unwatchable.add(path)
+
+    def mark_dirty(self, path):
+        with self._lock:
+            if path in self._watched:
+                self._dirty.add(path)
+
+    def watch(self, path):
+        """Start watching the directory ``path``. Return ``False`` if it
+        cannot be watched.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Stop watching.
+        """
+        self.closed = True
+
+
+def ignored(name):
+    return os.path.splitext(name)[1] in fanstatic.checksum.IGNORED_EXTENSIONS
+
+
+def fingerprint(path):
+    """Return the paths, modification times and sizes of everything in
+    the directory ``path``.
+    """
+    result = set()
+    for entry in fanstatic.checksum.list_directory(path):
+        try:
+            stat = os.stat(entry)
+        except OSError:
+            continue
+        result.add((entry, stat.st_mtime_ns, stat.st_size))
+    return result
+
+
+class PollingWatcher(Watcher):
+    """Watch directories by comparing the modification times and sizes of
+    their contents in a background thread, every ``interval`` seconds.
+    """
+
+    def __init__(self, interval=1.0):
+        super().__init__()
+        self.interval = interval
+        self._fingerprints = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def watch(self, path):
+        self._fingerprints[path] = fingerprint(path)
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='fanstatic-watcher', daemon=True)
+            self._thread.start()
+        return True
+
+    def _run(self):
+        while not self.closed:
+            self._wakeup.wait(self.interval)
+            for path, previous in list(self._fingerprints.items()):
+                if self.closed:
+                    break
+                current = fingerprint(path)
+                if current != previous:
+                    self._fingerprints[path] = current
+                    self.mark_dirty(path)
+
+    def close(self):
+        super().close()
+        self._wakeup.set()
+
+
+# From <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+EVENT = struct.Struct('iIII')
+
+
+def load_libc():
+    """Return the C library if it has the inotify functions, or ``None``.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(
+            ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [
+        ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+class InotifyWatcher(Watcher):
+    """Watch directories with the Linux inotify API.
+
+    Each directory of a watched tree gets an inotify watch; the events are
+    read in a background thread. Changes to files with an extension in
+    :py:data:`fanstatic.checksum.IGNORED_EXTENSIONS` are ignored, as are
+    version control directories.
+
+    :param libc: the C library, as returned by :py:func:`load_libc`.
+    """
+
+    def __init__(self, libc):
+        super().__init__()
+        self._libc = libc
+        self._fd = libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        # watch descriptor -> (directory, watched paths). Inotify returns
+        # the same descriptor for a directory that is in several watched
+        # paths, such as nested library directories.
+        self._descriptors = {}
+        self._thread = threading.Thread(
+            target=self._run, name='fanstatic-watcher', daemon=True)
+        self._thread.start()
+
+    def watch(self, path):
+        for directory in fanstatic.checksum.list_directory(path):
+            if os.path.isdir(directory) and \
+                    not self._add_watch(path, directory):
+                return False
+        return True
+
+    def _add_watch(self, path, directory):
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            # Most likely the limit of watches was reached.
+            return False
+        with self._lock:
+            self._descriptors.setdefault(wd, (directory, set()))[1].add(path)
+        return True
+
+    def _run(self):
+        while not self.closed:
+            readable, _, _ = select.select([self._fd], [], [], 1.0)
+            if not readable:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError:
+                break
+            self._handle(data)
+
+    def _handle(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost.
+                for path in list(self._watched):
+                    self.mark_dirty(path)
+                continue
+            with self._lock:
+                if mask & IN_IGNORED:
+                    watched = self._descriptors.pop(wd, None)
+                else:
+                    watched = self._descriptors.get(wd)
+                if watched is not None:
+                    directory, paths = watched[0], list(watched[1])
+            if watched is None:
+                continue
+            name = os.fsdecode(name)
+            if name in fanstatic.checksum.VCS_NAMES or \
+                    (name and not mask & IN_ISDIR and ignored(name)):
+                continue
+            for path in paths:
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    for subdirectory in fanstatic.checksum.list_directory(
+                            os.path.join(directory, name)):
+                        if os.path.isdir(subdirectory) and \
+                                not self._add_watch(path, subdirectory):
+                            self.unwatchable(path)
+                self.mark_dirty(path)
+
+    def close(self):
+        super().close()
+        self._thread.join()
+        os.close(self._fd)
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def get_watcher():
+    """Return the process-wide watcher, starting it the first time.
+
+    This is an :py:class:`InotifyWatcher` if inotify can be used, and a
+    :py:class:`PollingWatcher` otherwise.
+    """
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            libc = load_libc()
+            try:
+                _watcher = InotifyWatcher(libc) if libc is not None else None
+            except OSError:
+                pass
+            if _watcher is None:
+                _watcher = PollingWatcher()
+        return _watcher
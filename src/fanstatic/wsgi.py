@@ -12,6 +12,8 @@ from fanstatic.config import convert_config
 def Fanstatic(app,
               publisher_signature=fanstatic.DEFAULT_SIGNATURE,
               injector=None,
+              compress=False,
+              publisher_cache_size=1000,
               **config):
     """Fanstatic WSGI framework component.
 
@@ -22,6 +24,12 @@ def Fanstatic(app,
 
     :param injector: A injector callable.
 
+    :param compress: If ``True``, the publisher serves resources
+      compressed to clients that accept it, see :py:class:`Publisher`.
+
+    :param publisher_cache_size: The ``cache_size`` of the publisher, the
+      maximum number of URLs it keeps resolved.
+
     :param ``**config``: Optional keyword arguments. These are
       passed to :py:class:`NeededInclusions` when it is constructed.
     """
@@ -33,7 +41,9 @@ def Fanstatic(app,
         injector=injector,
         **config)
 
-    publisher_middleware = Publisher(LibraryRegistry.instance())
+    publisher_middleware = Publisher(
+        LibraryRegistry.instance(), compress=compress,
+        cache_size=publisher_cache_size)
 
     return Delegator(
         injector_middleware,